@@ -1,189 +1,834 @@
-from os.path import isfile
+import os
+from os.path import isfile, getsize
 import re
+import mmap
+import codecs
+import traceback
 import numpy as np
-from typing import Tuple, Dict, Union
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Tuple, Dict, Union, List, Optional, Iterable, Iterator, Any
 from unyt import unyt_array, unyt_quantity
+from tqdm import tqdm
 
 # Matching tool for floats in strings
 float_match = re.compile('\d+(\.\d+)?')
 
+# Whitespace-only line that closes the step block
+step_block_end = re.compile(rb'^ [ \t\r\f\v]*$', re.MULTILINE)
+scheduler_report_line = re.compile(rb'^.*scheduler_report_task_times: .*$', re.MULTILINE)
+
+# Delimiters around the header values printed once in the preamble of the log
+header_delimiters = {
+    'num_particles': ('main: Running on', 'gas'),
+    'num_ranks': ('main: MPI is up and running with', 'node'),
+    'threads_per_rank': ('ranks,', 'threads / rank'),
+    'num_top_level_cells': ('parts in', 'cells.'),
+    'ic_loading_time': ('main: Reading initial conditions took', 'ms'),
+}
+
+# Columns of the step lines printed by SWIFT after the `#   Step` table header.
+# Older versions of SWIFT do not print the dead time, which is then left as NaN.
+step_dtype = np.dtype([
+    ('step', np.int64),
+    ('time', np.float64),
+    ('scale_factor', np.float64),
+    ('redshift', np.float64),
+    ('time_step', np.float64),
+    ('min_time_bin', np.int64),
+    ('max_time_bin', np.int64),
+    ('updates', np.int64),
+    ('g_updates', np.int64),
+    ('s_updates', np.int64),
+    ('sink_updates', np.int64),
+    ('b_updates', np.int64),
+    ('wallclock_time', np.float64),
+    ('properties', np.int64),
+    ('dead_time', np.float64),
+])
+step_converters = [int if step_dtype[i].kind == 'i' else float for i in range(len(step_dtype))]
+step_integer_columns = [i for i in range(len(step_dtype)) if step_dtype[i].kind == 'i']
+min_step_columns = step_dtype.names.index('properties') + 1
+
+# One record per category line of a scheduler_report_task_times block
+report_dtype = np.dtype([
+    ('step', np.int64),
+    ('rank', np.int64),
+    ('category', np.int64),
+    ('time', np.float64),
+])
+
+scheduler_categories = [
+    'drift',
+    'sorts',
+    'resort',
+    'hydro',
+    'gravity',
+    'feedback',
+    'black holes',
+    'cooling',
+    'star formation',
+    'limiter',
+    'sync',
+    'time integration',
+    'mpi',
+    'fof',
+    'others',
+    'sink',
+    'dead time',
+    'total'
+]
+
+
+class LineMatcher:
+    # Base class for the line handlers registered with the StdoutParser.
+    # A matcher that has collected everything it needs sets `done` and
+    # is no longer fed any lines.
+    done = False
+
+    def feed(self, line: str, line_number: int) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class DelimitedValueMatcher(LineMatcher):
+    # Stores the text between the first pair of delimiters found in the log
+
+    def __init__(self, delimiters: Tuple[str, str]):
+        self.delimiters = delimiters
+        self.pattern = re.compile(f'{re.escape(delimiters[0])}(.*){re.escape(delimiters[1])}')
+        self.value: Optional[str] = None
+
+    def feed(self, line: str, line_number: int) -> None:
+
+        # Check if both delimiters are in the line
+        if self.delimiters[0] in line and self.delimiters[1] in line:
+            result = self.pattern.search(line.strip())
+            if result is None:
+                raise ValueError(f'Keyword could not be matched to delimiters {self.delimiters}')
+            self.value = result.group(1).strip()
+            self.done = True
+
+
+class HeaderMatcher(LineMatcher):
+    # Collects all the header values with a single combined regex. The
+    # values are printed in the preamble, so the matcher is done once they
+    # are all found or when the step table starts.
+    pattern = re.compile('|'.join(
+        f'{re.escape(delimiters[0])}(?P<{key}>.*){re.escape(delimiters[1])}'
+        for key, delimiters in header_delimiters.items()
+    ))
+
+    def __init__(self):
+        self.values: Dict[str, Optional[str]] = {key: None for key in header_delimiters}
+        self.missing = len(self.values)
+
+    def feed(self, line: str, line_number: int) -> None:
+
+        if line.startswith('#   Step'):
+            self.done = True
+            return
+
+        for match in self.pattern.finditer(line):
+            if self.values[match.lastgroup] is None:
+                self.values[match.lastgroup] = match.group(match.lastgroup).strip()
+                self.missing -= 1
+
+        self.done = self.missing == 0
+
+
+@dataclass(frozen=True)
+class StdoutHeader:
+    # Typed header values, None for the values not found in the preamble
+    num_particles: Optional[int] = None
+    num_ranks: Optional[int] = None
+    threads_per_rank: Optional[int] = None
+    num_top_level_cells: Optional[int] = None
+    ic_loading_time: Optional[unyt_quantity] = None
+
+    @classmethod
+    def from_values(cls, values: Dict[str, Optional[str]]) -> 'StdoutHeader':
+        converters = {'ic_loading_time': lambda value: unyt_quantity(float(value), 'ms')}
+        return cls(**{
+            key: None if value is None else converters.get(key, int)(value)
+            for key, value in values.items()
+        })
+
+
+class RecordTable:
+    # Growable columnar buffer of records. The capacity is doubled when
+    # full, so appending n records costs O(n) amortised, and `array`
+    # returns a zero-copy view of the filled rows.
+
+    def __init__(self, dtype: np.dtype, capacity: int = 1024):
+        self._buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def reserve(self, capacity: int) -> None:
+        if capacity > len(self._buffer):
+            buffer = np.empty(max(capacity, 2 * len(self._buffer)), dtype=self._buffer.dtype)
+            buffer[:self.size] = self._buffer[:self.size]
+            self._buffer = buffer
 
-class Stdout:
-    def __init__(self, stdout_file_path: str):
-        assert isfile(stdout_file_path), f"File does not exist: {stdout_file_path}"
+    def append(self, values: Tuple) -> None:
+        self.reserve(self.size + 1)
+        self._buffer[self.size] = values
+        self.size += 1
+
+    def extend(self, values: np.ndarray) -> None:
+
+        # Append a 2D block of rows, column by column. Missing trailing
+        # columns (e.g. the dead time of the step lines) are set to NaN.
+        num_rows = values.shape[0]
+        self.reserve(self.size + num_rows)
+        for i, name in enumerate(self._buffer.dtype.names):
+            if i < values.shape[1]:
+                self._buffer[name][self.size:self.size + num_rows] = values[:, i]
+            else:
+                self._buffer[name][self.size:self.size + num_rows] = np.nan
+        self.size += num_rows
+
+    def extend_records(self, records: np.ndarray) -> None:
+        self.reserve(self.size + len(records))
+        self._buffer[self.size:self.size + len(records)] = records
+        self.size += len(records)
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._buffer[:self.size]
+
+
+class StepTable(RecordTable):
+    # Buffer for the step lines
+
+    def __init__(self, capacity: int = 1024):
+        super().__init__(step_dtype, capacity=capacity)
+
+
+class StepBlockMatcher(LineMatcher):
+    # Collects the step lines printed after the `#   Step` table header.
+    # Step lines are buffered and converted in bulk with np.loadtxt; the
+    # slower line-by-line conversion is only used on batches that contain
+    # malformed lines, to report them and stop at the first one.
+
+    def __init__(self, stdout_file_path: str, header: int = 40, batch_size: int = 65536):
         self.stdout_file_path = stdout_file_path
-        with open(stdout_file_path, 'r') as file_handle:
-            self.file_lines = file_handle.readlines()
+        self.header = header
+        self.batch_size = batch_size
+        self.start_integration = False
+        self.table = StepTable()
+        self.batch_lines: List[str] = []
+        self.batch_line_numbers: List[int] = []
 
-    def find_value_in_line(self, delimiters: Tuple[str]) -> str:
-        for line in self.file_lines:
-            line = line.strip()
+    def feed(self, line: str, line_number: int) -> None:
 
-            # Check if both delimiters are in the line
-            if delimiters[0] in line and delimiters[1] in line:
-                result = re.search(f'{delimiters[0]}(.*){delimiters[1]}', line)
-                if result is None:
-                    raise ValueError(f'Keyword could not be matched to delimiters {delimiters}')
-                result = result.group(1)
+        if self.done or line_number < self.header:
+            return
 
-                # Convert to final value type. Returning stops the loop
-                return result.strip()
+        if line.startswith('#   Step'):
+            self.start_integration = True
+            return
 
-    def num_particles(self) -> int:
+        if not self.start_integration or not line.startswith(' '):
+            return
 
-        return int(
-            self.find_value_in_line(
-                delimiters=('main: Running on', 'gas'),
-            )
-        )
+        if len(line.strip()) == 0:
+            self.flush()
+            self.done = True
+            return
 
-    def num_ranks(self) -> int:
+        self.batch_lines.append(line)
+        self.batch_line_numbers.append(line_number)
+        if len(self.batch_lines) >= self.batch_size:
+            self.flush()
 
-        return int(
-            self.find_value_in_line(
-                delimiters=('main: MPI is up and running with', 'node'),
+    def close(self) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+
+        if len(self.batch_lines) == 0:
+            return
+
+        try:
+            values = np.loadtxt(self.batch_lines, dtype=np.float64, ndmin=2)
+            is_valid = (
+                    min_step_columns <= values.shape[1] <= len(step_dtype)
+                    and np.all(np.mod(values[:, step_integer_columns], 1) == 0)
             )
+        except ValueError:
+            is_valid = False
+
+        if is_valid:
+            self.table.extend(values)
+        else:
+            for line, line_number in zip(self.batch_lines, self.batch_line_numbers):
+                if not self.parse_line(line, line_number):
+                    break
+
+        self.batch_lines = []
+        self.batch_line_numbers = []
+
+    def parse_line(self, line: str, line_number: int) -> bool:
+
+        split_line = line.split()
+
+        try:
+            if len(split_line) < min_step_columns:
+                raise IndexError(f'Expected at least {min_step_columns} columns, found {len(split_line)}')
+
+            # Convert every column of the step line, padding a missing dead time
+            values = tuple(
+                converter(value) for converter, value in zip(step_converters, split_line)
+            ) + (np.nan,) * (len(step_converters) - len(split_line))
+
+        except (ValueError, IndexError) as err:
+
+            print((
+                f"Found {len(self.table)} timesteps in stdout:\n{self.table.array['step']}\n"
+                f"Error found in file: {self.stdout_file_path}\n"
+                f"Error found in line {line_number}: {line}\n"
+                f"Split line: {split_line}"
+            ))
+
+            if len(self.table) > 0:
+                self.done = True
+                return False
+            else:
+                raise err
+
+        self.table.append(values)
+        return True
+
+
+class SchedulerReportMatcher(LineMatcher):
+    # Collects the per-category times printed by scheduler_report_task_times
+    # as (step, rank, category, time) records. The rank is read from the
+    # `[0000]` prefix of the line. SWIFT prints the summary line of a step
+    # at the start of the following engine_step, after the report of that
+    # step, so each report is assigned to the next step line in the log.
+    # Reports not followed by a step line yet have step -1.
+
+    def __init__(self, categories: List[str]):
+        self.categories = categories
+        self.category_index = {category: i for i, category in enumerate(categories)}
+        self.pattern = re.compile(
+            '(?P<category>' + '|'.join(re.escape(category) for category in categories) + '):(?P<time>.*)ms'
         )
+        self.table = RecordTable(report_dtype)
+        self.pending = 0
+
+    def feed(self, line: str, line_number: int) -> None:
+
+        if line.startswith(' '):
+            step = line.split(None, 1)
+            if len(step) > 0 and step[0].isdigit() and self.pending < len(self.table):
+                self.table._buffer['step'][self.pending:len(self.table)] = int(step[0])
+                self.pending = len(self.table)
+            return
+
+        if 'scheduler_report_task_times: ' not in line:
+            return
+
+        # Search for value between delimiters
+        result = self.pattern.search(line)
+        if result is None:
+            return
+        time = result.group('time').strip()
+        assert float_match.match(time) is not None, f"{time}"
+
+        rank = 0
+        if line.startswith('['):
+            try:
+                rank = int(line[1:line.index(']')])
+            except ValueError:
+                pass
+
+        self.table.append((-1, rank, self.category_index[result.group('category')], float(time)))
+
+    def restore(self, records: np.ndarray) -> None:
+        self.table.extend_records(records)
+        unassigned = np.flatnonzero(records['step'] < 0)
+        self.pending = len(records) if len(unassigned) == 0 else unassigned[0]
+
+    @property
+    def task_times(self) -> Dict[str, np.ndarray]:
+        # Times of each category in order of appearance, for all ranks
+        records = self.table.array
+        return {
+            category: records['time'][records['category'] == i] for i, category in enumerate(self.categories)
+        }
+
+    def rank_task_times(self, rank: int = 0) -> Dict[str, np.ndarray]:
+        # Times of each category in order of appearance, for one rank
+        records = self.table.array
+        records = records[records['rank'] == rank]
+        return {
+            category: records['time'][records['category'] == i] for i, category in enumerate(self.categories)
+        }
+
+
+class StdoutParser:
+    # Single-pass line dispatcher. The file is read in chunks of `chunk_size`
+    # characters and each complete line is handed to all the active matchers,
+    # so memory use does not grow with the size of the log. The parser keeps
+    # the byte offset and line number after the last complete line, so that
+    # `follow` can later resume on the lines appended by a running job.
+
+    def __init__(self, matchers: List[LineMatcher], chunk_size: int = 16 * 1024 ** 2):
+        self.matchers = matchers
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.line_number = 0
+
+    def dispatch(self, line: str, line_number: int) -> bool:
+        for matcher in self.matchers:
+            if not matcher.done:
+                matcher.feed(line, line_number)
+        return all(matcher.done for matcher in self.matchers)
+
+    def parse_chunks(self, chunks: Iterable[str], final: bool = True) -> Optional[str]:
+
+        # Returns the trailing incomplete line, which is only dispatched if
+        # `final` is set, or None if all the matchers were satisfied early
+        remainder = ''
+        for chunk in chunks:
+            lines = (remainder + chunk).split('\n')
+            remainder = lines.pop()
+            for line in lines:
+                if self.dispatch(line, self.line_number):
+                    return None
+                self.line_number += 1
+
+        if final and remainder:
+            if self.dispatch(remainder, self.line_number):
+                return None
+            self.line_number += 1
+            remainder = ''
+
+        return remainder
+
+    def close(self) -> None:
+        for matcher in self.matchers:
+            matcher.close()
+
+    def follow(self, stdout_file_path: str, final: bool = False) -> int:
+
+        # Parse the lines written after `offset` and return the number of
+        # bytes consumed. An incomplete last line is left for the next call.
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        bytes_read = 0
+
+        with open(stdout_file_path, 'rb') as file_handle:
+            file_handle.seek(self.offset)
+
+            def chunks() -> Iterator[str]:
+                nonlocal bytes_read
+                for block in iter(lambda: file_handle.read(self.chunk_size), b''):
+                    bytes_read += len(block)
+                    yield decoder.decode(block, final=final and len(block) < self.chunk_size)
+
+            remainder = self.parse_chunks(chunks(), final=final)
+
+        if remainder is None:
+            return 0
+
+        bytes_consumed = bytes_read - len(remainder.encode()) - len(decoder.getstate()[0])
+        self.offset += bytes_consumed
+        return bytes_consumed
+
+    def parse(self, stdout_file_path: str) -> None:
+        self.follow(stdout_file_path, final=True)
+        self.close()
+
+
+def mmap_chunks(buffer: mmap.mmap, start: int, end: int, chunk_size: int) -> Iterator[str]:
+
+    # Decode a byte range of the memory map a chunk at a time, without
+    # splitting multi-byte characters across chunks
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for position in range(start, end, chunk_size):
+        yield decoder.decode(buffer[position:min(position + chunk_size, end)])
+    yield decoder.decode(b'', final=True)
+
+
+def to_shared_memory(arrays: Dict[str, np.ndarray]) -> Tuple[str, Dict[str, Tuple[int, np.dtype, Tuple]]]:
+
+    # Pack the arrays into one shared memory block and return its name and
+    # layout. The block is left for the receiving process to unlink.
+    size = sum(array.nbytes for array in arrays.values())
+    shared_memory = SharedMemory(create=True, size=max(size, 1))
+    layout = dict()
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf, offset=offset)[...] = array
+        layout[name] = (offset, array.dtype, array.shape)
+        offset += array.nbytes
+    shared_memory.close()
+
+    # Ownership passes to the receiving process, which unlinks the block, so
+    # this process's resource tracker must not report it as leaked at exit.
+    # The block sizes are only known once the log is parsed, so the block
+    # cannot be created by the receiver. The tracker is keyed by the private
+    # _name, which on POSIX keeps the leading '/' stripped from .name; only
+    # POSIX blocks are registered with it.
+    if os.name == 'posix':
+        resource_tracker.unregister(shared_memory._name, 'shared_memory')
+    return shared_memory.name, layout
+
+
+def from_shared_memory(name: str, layout: Dict[str, Tuple[int, np.dtype, Tuple]]) -> Dict[str, np.ndarray]:
+    shared_memory = SharedMemory(name=name)
+    try:
+        arrays = {
+            key: np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf, offset=offset).copy()
+            for key, (offset, dtype, shape) in layout.items()
+        }
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+    return arrays
+
+
+def load_worker(stdout_file_path: str, header: int, stdout_kwargs: Dict[str, Any]) -> Tuple:
+
+    # Runs in the pool: parse one log and return its arrays through shared
+    # memory, so that only the small header values and layout are pickled.
+    # Errors are returned rather than raised, so one bad log does not abort
+    # the batch.
+    try:
+        stdout = Stdout(stdout_file_path, **stdout_kwargs)
+        stdout._parsed(header=header)
+        arrays = {
+            'step_table': stdout.step_block.table.array,
+            'scheduler_reports': stdout.scheduler_report.table.array,
+        }
+        return stdout_file_path, stdout.header_values, *to_shared_memory(arrays), None
+
+    except Exception:
+        return stdout_file_path, None, None, None, traceback.format_exc()
 
-    def threads_per_rank(self) -> int:
 
-        return int(
-            self.find_value_in_line(
-                delimiters=('ranks,', 'threads / rank'),
-            )
+class Stdout:
+    def __init__(
+            self,
+            stdout_file_path: str,
+            chunk_size: int = 16 * 1024 ** 2,
+            use_mmap: bool = False,
+            cache=None
+    ):
+        assert isfile(stdout_file_path), f"File does not exist: {stdout_file_path}"
+        self.stdout_file_path = stdout_file_path
+        self.chunk_size = chunk_size
+        self.use_mmap = use_mmap
+        self.cache = cache
+        self.header_values: Dict[str, Optional[str]] = dict()
+        self._header: Optional[StdoutHeader] = None
+        self.step_block: Optional[StepBlockMatcher] = None
+        self.scheduler_report: Optional[SchedulerReportMatcher] = None
+        self.parser: Optional[StdoutParser] = None
+        self._file_handle = None
+        self._buffer: Optional[mmap.mmap] = None
+        self._line_offsets = np.zeros(1, dtype=np.int64)
+        self._line_offsets_scanned = 0
+
+    def parse(self, header: int = 40) -> None:
+
+        # Header metadata, step table and scheduler reports are filled in
+        # together in a single pass over the file
+        header_matcher = HeaderMatcher()
+        self.header_values = header_matcher.values
+        self._header = None
+        self.step_block = StepBlockMatcher(self.stdout_file_path, header=header)
+        self.scheduler_report = SchedulerReportMatcher(scheduler_categories)
+
+        self.parser = StdoutParser(
+            [header_matcher, self.step_block, self.scheduler_report],
+            chunk_size=self.chunk_size
         )
 
-    def num_top_level_cells(self) -> int:
+        if self.use_mmap and getsize(self.stdout_file_path) > 0:
 
-        return int(
-            self.find_value_in_line(
-                delimiters=('parts in', 'cells.'),
+            # The header section and the rest of the log are read from the
+            # memory map. Past the step block only the scheduler report
+            # matcher is left, as for the lines read from the file.
+            step_start, _ = self.step_block_span(header=header)
+            remainder = self.parser.parse_chunks(
+                mmap_chunks(self.buffer, 0, step_start, self.chunk_size),
+                final=False
             )
-        )
+            if remainder == '':
+                remainder = self.parser.parse_chunks(
+                    mmap_chunks(self.buffer, step_start, len(self.buffer), self.chunk_size),
+                    final=False
+                )
+                if remainder is not None:
+                    self.parser.offset = len(self.buffer) - len(remainder.encode())
+            elif remainder is not None:
+                # No step block yet, the header section ends mid-line
+                self.parser.offset = step_start - len(remainder.encode())
+            self.parser.close()
+
+        else:
+            # Lines are only parsed once complete, so that the log can be
+            # followed with refresh() while the job is still writing to it
+            self.parser.follow(self.stdout_file_path)
+            self.parser.close()
+
+    def refresh(self) -> int:
+
+        # Parse the lines appended to the log since the last parse and extend
+        # the step table and scheduler report. Returns the number of new bytes.
+        # The memory map is dropped as it does not cover the appended bytes.
+        self.close()
+        if self.step_block is None or self.parser is None or getsize(self.stdout_file_path) < self.parser.offset:
+            self.parse(header=40 if self.step_block is None else self.step_block.header)
+            return self.parser.offset
+
+        bytes_consumed = self.parser.follow(self.stdout_file_path)
+        self.parser.close()
+        self._header = None
+        return bytes_consumed
+
+    def restore(
+            self,
+            header_values: Dict[str, Optional[str]],
+            step_table: np.ndarray,
+            scheduler_reports: np.ndarray,
+            header: int = 40
+    ) -> None:
+
+        # Set the parsed state directly, e.g. from a StdoutCache entry.
+        # There is no parser state to resume from, so refresh() reparses.
+        self.parser = None
+        self.header_values = {key: header_values.get(key) for key in header_delimiters}
+        self._header = None
+
+        self.step_block = StepBlockMatcher(self.stdout_file_path, header=header)
+        self.step_block.table.extend_records(step_table)
+
+        self.scheduler_report = SchedulerReportMatcher(scheduler_categories)
+        self.scheduler_report.restore(scheduler_reports)
+
+    @classmethod
+    def load_many(
+            cls,
+            stdout_file_paths: List[str],
+            workers: Optional[int] = None,
+            header: int = 40,
+            silent_progressbar: bool = False,
+            **stdout_kwargs
+    ) -> Tuple[Dict[str, 'Stdout'], Dict[str, str]]:
+
+        # Parse many logs in a process pool. Returns the parsed Stdout objects
+        # and the tracebacks of the logs that failed, both keyed by path.
+        workers = os.cpu_count() if workers is None else workers
+        stdouts = dict()
+        failures = dict()
+
+        def collect(result: Tuple) -> None:
+            stdout_file_path, header_values, name, layout, error = result
+            if error is not None:
+                print(f"Failed to parse {stdout_file_path}:\n{error}")
+                failures[stdout_file_path] = error
+                return
+
+            arrays = from_shared_memory(name, layout)
+            stdout = cls(stdout_file_path, **stdout_kwargs)
+            stdout.restore(
+                header_values=header_values,
+                step_table=arrays['step_table'],
+                scheduler_reports=arrays['scheduler_reports'],
+                header=header
+            )
+            stdouts[stdout_file_path] = stdout
+
+        progress = tqdm(total=len(stdout_file_paths), desc='[Stdout] Parsing logs', disable=silent_progressbar)
+        if workers <= 1:
+            for stdout_file_path in stdout_file_paths:
+                collect(load_worker(stdout_file_path, header, stdout_kwargs))
+                progress.update()
+
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(load_worker, stdout_file_path, header, stdout_kwargs): stdout_file_path
+                    for stdout_file_path in stdout_file_paths
+                }
+                for future in as_completed(futures):
+                    try:
+                        collect(future.result())
+                    except Exception:
+                        # The worker process itself died
+                        print(f"Failed to parse {futures[future]}:\n{traceback.format_exc()}")
+                        failures[futures[future]] = traceback.format_exc()
+                    progress.update()
+
+        progress.close()
+
+        # Keep the order of the input paths
+        stdouts = {path: stdouts[path] for path in stdout_file_paths if path in stdouts}
+        return stdouts, failures
+
+    def _parsed(self, header: Optional[int] = None) -> None:
+        if self.step_block is None or (header is not None and header != self.step_block.header):
+            header = 40 if header is None else header
+            if self.cache is not None:
+                key = self.cache.key(self.stdout_file_path, header)
+                if self.cache.load(self, key):
+                    return
+            self.parse(header=header)
+            if self.cache is not None:
+                self.cache.store(self, key)
+
+    @property
+    def buffer(self) -> mmap.mmap:
+
+        # Read-only memory map of the log, opened on first use
+        if self._buffer is None:
+            self._file_handle = open(self.stdout_file_path, 'rb')
+            self._buffer = mmap.mmap(self._file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._buffer
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file_handle.close()
+            self._buffer = None
+            self._file_handle = None
+
+    def line_offsets(self, end: Optional[int] = None) -> np.ndarray:
+
+        # Byte offsets of the start of each line up to `end`. The memory map
+        # is scanned for newlines only as far as has been asked for.
+        end = len(self.buffer) if end is None else min(end, len(self.buffer))
+        while self._line_offsets_scanned < end:
+            start = self._line_offsets_scanned
+            stop = min(start + self.chunk_size, len(self.buffer))
+            chunk = np.frombuffer(self.buffer, dtype=np.uint8, count=stop - start, offset=start)
+            newlines = np.flatnonzero(chunk == ord('\n')) + start + 1
+            del chunk
+            self._line_offsets = np.concatenate([self._line_offsets, newlines])
+            self._line_offsets_scanned = stop
+
+        return self._line_offsets[:np.searchsorted(self._line_offsets, end, side='right')]
+
+    def line_number(self, offset: int) -> int:
+        return int(np.searchsorted(self.line_offsets(end=offset), offset, side='right') - 1)
+
+    def step_block_span(self, header: int = 40) -> Tuple[int, int]:
+
+        # Byte range from the first `#   Step` table header after line
+        # `header` to the whitespace-only line closing the step block
+        position = 0
+        while True:
+            position = self.buffer.find(b'#   Step', position)
+            if position < 0:
+                return len(self.buffer), len(self.buffer)
+            if (position == 0 or self.buffer[position - 1] == ord('\n')) and self.line_number(position) >= header:
+                break
+            position += 1
+
+        end = step_block_end.search(self.buffer, position)
+        if end is None:
+            return position, len(self.buffer)
+
+        return position, min(end.end() + 1, len(self.buffer))
+
+    def header_section(self, header: int = 40) -> str:
+        step_start, _ = self.step_block_span(header=header)
+        return self.buffer[:step_start].decode(errors='replace')
+
+    def scheduler_report_lines(self) -> Iterator[str]:
+        for match in scheduler_report_line.finditer(self.buffer):
+            yield match.group().decode(errors='replace')
+
+    def find_value_in_line(self, delimiters: Tuple[str]) -> str:
 
-    def ic_loading_time(self) -> unyt_quantity:
+        # Stream the file only until the delimiters are matched
+        matcher = DelimitedValueMatcher(delimiters)
+        StdoutParser([matcher], chunk_size=self.chunk_size).parse(self.stdout_file_path)
+        return matcher.value
 
-        return unyt_quantity(
-            float(
-                self.find_value_in_line(
-                    delimiters=('main: Reading initial conditions took', 'ms'),
+    def header(self) -> StdoutHeader:
+
+        # Unless the log was already parsed, only its preamble is read
+        if self._header is None:
+            if self.step_block is None:
+                header_matcher = HeaderMatcher()
+                StdoutParser([header_matcher], chunk_size=min(self.chunk_size, 1024 ** 2)).parse(
+                    self.stdout_file_path
                 )
-            ), 'ms'
-        )
+                self.header_values = header_matcher.values
+            self._header = StdoutHeader.from_values(self.header_values)
+        return self._header
 
-    def analyse_stdout(self, header: int = 40) -> Tuple[Union[np.ndarray, unyt_array]]:
+    def header_value(self, key: str) -> Optional[str]:
+        self.header()
+        return self.header_values[key]
 
-        lines = self.file_lines[header:]
-        timestep_number = np.empty(0, dtype=int)
-        particle_updates = np.empty(0, dtype=int)
-        timestep_duration = np.empty(0, dtype=float)
-        timestep_properties = np.empty(0, dtype=int)
+    def num_particles(self) -> Optional[int]:
 
-        start_integration = False
-        for line_number, line in enumerate(lines):
+        return self.header().num_particles
 
-            if line.startswith('#   Step'):
-                start_integration = True
-                continue
+    def num_ranks(self) -> Optional[int]:
 
-            if start_integration and line.startswith(' ') and len(line.strip().split()) == 0:
-                break
+        return self.header().num_ranks
 
-            if start_integration and line.startswith(' '):
-
-                line = line.strip().split()
-
-                try:
-
-                    # Split time-step number and duration
-                    timestep_number = np.append(
-                        timestep_number,
-                        int(line[0])
-                    )
-                    particle_updates = np.append(
-                        particle_updates,
-                        int(line[7])
-                    )
-                    timestep_duration = np.append(
-                        timestep_duration,
-                        float(line[12])
-                    )
-                    timestep_properties = np.append(
-                        timestep_properties,
-                        int(line[13])
-                    )
-
-                except (ValueError, IndexError) as err:
-
-                    print((
-                        f"Found {len(timestep_number)} timesteps in stdout:\n{timestep_number}\n"
-                        f"Error found in file: {self.stdout_file_path}\n"
-                        f"Error found in line {line_number}: {lines[line_number]}\n"
-                        f"Split line: {line}"
-                    ))
-
-                    if len(timestep_properties) > 0:
-                        break
-                    else:
-                        raise err
-
-        if len(timestep_number) > 0:
-            max_timestep = timestep_number[-1]
-            assert len(timestep_number) == max_timestep + 1
-            assert len(particle_updates) == max_timestep + 1
-            assert len(timestep_duration) == max_timestep + 1
-            assert len(timestep_properties) == max_timestep + 1
-
-        return timestep_number, particle_updates, unyt_array(timestep_duration, 'ms'), timestep_properties
+    def threads_per_rank(self) -> Optional[int]:
 
-    def scheduler_report_task_times(self, no_zeros: bool = False) -> Dict[str, unyt_array]:
+        return self.header().threads_per_rank
 
-        categories = [
-            'drift',
-            'sorts',
-            'resort',
-            'hydro',
-            'gravity',
-            'feedback',
-            'black holes',
-            'cooling',
-            'star formation',
-            'limiter',
-            'sync',
-            'time integration',
-            'mpi',
-            'fof',
-            'others',
-            'sink',
-            'dead time',
-            'total'
-        ]
+    def num_top_level_cells(self) -> Optional[int]:
 
-        scheduler_report = dict()
-        for category in categories:
-            scheduler_report[category] = np.empty(0, dtype=float)
+        return self.header().num_top_level_cells
 
-            for line in self.file_lines:
-                if 'scheduler_report_task_times: ' in line and category in line:
+    def ic_loading_time(self) -> Optional[unyt_quantity]:
 
-                    # Search for value between delimiters
-                    delimiters = f'{category}:', 'ms'
-                    result = re.search(f'{delimiters[0]}(.*){delimiters[1]}', line)
-                    result = result.group(1).strip()
+        return self.header().ic_loading_time
 
-                    assert float_match.match(result) is not None, f"{result}"
-                    result = float(result)
+    def step_table(self, header: int = 40) -> np.ndarray:
 
-                    # If slim version wanted, don't append zero values
-                    if not (no_zeros and round(result, 2) == 0.):
-                        scheduler_report[category] = np.append(
-                            scheduler_report[category],
-                            result
-                        )
+        # Structured array with one record per step and one field per column
+        self._parsed(header=header)
+        steps = self.step_block.table.array
 
-            # If slim version wanted, delete the fields with no contribution
-            if no_zeros and len(scheduler_report[category]) == 0:
-                del scheduler_report[category]
+        if len(steps) > 0:
+            max_timestep = steps['step'][-1]
+            assert len(steps) == max_timestep + 1
+
+        return steps
+
+    def analyse_stdout(self, header: int = 40) -> Tuple[Union[np.ndarray, unyt_array]]:
+
+        # Views into the step table, no data is copied
+        steps = self.step_table(header=header)
+        return steps['step'], steps['updates'], unyt_array(steps['wallclock_time'], 'ms'), steps['properties']
+
+    def scheduler_report_task_times(self, no_zeros: bool = False) -> Dict[str, unyt_array]:
+
+        self._parsed()
+        scheduler_report = dict()
+        for category, task_times in self.scheduler_report.rank_task_times(rank=0).items():
+            scheduler_report[category] = task_times
+
+            # If slim version wanted, don't keep zero values
+            if no_zeros:
+                scheduler_report[category] = scheduler_report[category][
+                    np.round(scheduler_report[category], 2) != 0.
+                ]
+
+                # Delete the fields with no contribution
+                if len(scheduler_report[category]) == 0:
+                    del scheduler_report[category]
 
         # Note: these times are the total for all threads in rank 0.
         # To get the average time spent in the rank, divide by the
@@ -200,6 +845,32 @@ class Stdout:
 
         return scheduler_report
 
+    def scheduler_report_series(
+            self,
+            per_thread: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray, List[str], unyt_array]:
+
+        # Scheduler report times as a dense (steps, ranks, categories) array.
+        # Steps and ranks are those with at least one report; entries with
+        # no report are NaN. Category names use underscores, as in
+        # scheduler_report_task_times.
+        self._parsed()
+        records = self.scheduler_report.table.array
+        records = records[records['step'] >= 0]
+
+        steps, step_index = np.unique(records['step'], return_inverse=True)
+        ranks, rank_index = np.unique(records['rank'], return_inverse=True)
+        categories = [category.replace(' ', '_') for category in self.scheduler_report.categories]
+
+        times = np.full((len(steps), len(ranks), len(categories)), np.nan)
+        times[step_index, rank_index, records['category']] = records['time']
+
+        # Times are the total for all threads in the rank
+        if per_thread:
+            times /= self.threads_per_rank()
+
+        return steps, ranks, categories, unyt_array(times, 'ms')
+
 
 if __name__ == '__main__':
     cwd = '/cosma8/data/dr004/dc-alta2/4ranks_node/kh3d_N128_T8_P32_C4'
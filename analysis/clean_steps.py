@@ -0,0 +1,102 @@
+import numpy as np
+from functools import reduce
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+
+# Bits of the `properties` column of the SWIFT step lines
+# (enum engine_step_properties in src/engine.h)
+step_properties = {
+    'rebuild': 1 << 0,
+    'redistribute': 1 << 1,
+    'repartition': 1 << 2,
+    'statistics': 1 << 3,
+    'snapshot': 1 << 4,
+    'restarts': 1 << 5,
+    'stf': 1 << 6,
+    'fof': 1 << 7,
+    'mesh': 1 << 8,
+    'done': 1 << 9,
+    'line_of_sight': 1 << 10,
+    'power_spectra': 1 << 11,
+}
+
+
+@dataclass(frozen=True)
+class CleanStepRules:
+    # A step is clean if it has none of the `exclude` properties (any
+    # property if None) and its number of updates is within `updates_rtol`
+    # of the updates of the first step, i.e. a full step in the runs
+    # analysed here.
+    exclude: Optional[Tuple[str, ...]] = None
+    updates_rtol: float = 0.
+
+    @property
+    def property_mask(self) -> int:
+        if self.exclude is None:
+            return -1
+        return reduce(lambda mask, name: mask | step_properties[name], self.exclude, 0)
+
+    def mask(self, step_table: np.ndarray) -> np.ndarray:
+
+        if len(step_table) == 0:
+            return np.zeros(0, dtype=bool)
+
+        updates = step_table['updates'].astype(float)
+        return np.logical_and(
+            (step_table['properties'] & self.property_mask) == 0,
+            np.abs(updates - updates[0]) <= self.updates_rtol * updates[0]
+        )
+
+
+def clean_steps(step_table: np.ndarray, rules: CleanStepRules = CleanStepRules()) -> np.ndarray:
+
+    # Sorted numbers of the clean steps
+    return np.sort(step_table['step'][rules.mask(step_table)])
+
+
+def common_steps(step_numbers: List[np.ndarray]) -> np.ndarray:
+
+    # Intersection of sorted, unique step numbers
+    if len(step_numbers) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), step_numbers)
+
+
+def align_runs(
+        step_tables: Dict[str, np.ndarray],
+        rules: CleanStepRules = CleanStepRules()
+) -> Tuple[np.ndarray, List[str], List[str]]:
+
+    # Clean steps common to all runs with at least one clean step. Returns
+    # the common steps, the runs they were computed over and the runs with
+    # no clean steps.
+    runs = []
+    no_clean_steps = []
+    step_numbers = []
+    for run, step_table in step_tables.items():
+        steps = clean_steps(step_table, rules)
+        if len(steps) > 0:
+            runs.append(run)
+            step_numbers.append(steps)
+        else:
+            no_clean_steps.append(run)
+
+    return common_steps(step_numbers), runs, no_clean_steps
+
+
+def aligned_matrix(
+        step_tables: Dict[str, np.ndarray],
+        runs: List[str],
+        steps: np.ndarray,
+        column: str = 'wallclock_time'
+) -> np.ndarray:
+
+    # (runs, steps) matrix of `column`, NaN for the steps a run does not have
+    matrix = np.full((len(runs), len(steps)), np.nan)
+    for i, run in enumerate(runs):
+        step_table = step_tables[run]
+        index = np.searchsorted(step_table['step'], steps)
+        index = np.minimum(index, max(len(step_table) - 1, 0))
+        found = step_table['step'][index] == steps if len(step_table) > 0 else np.zeros(len(steps), dtype=bool)
+        matrix[i, found] = step_table[column][index[found]]
+    return matrix
@@ -0,0 +1,58 @@
+import random
+import pytest
+from analyse_stdout import scheduler_categories
+
+
+def write_log(
+        path: str,
+        num_steps: int = 20,
+        ranks: tuple = (0,),
+        reports: bool = True,
+        tail_reports: bool = False,
+        seed: int = 0
+) -> str:
+
+    # Synthetic SWIFT stdout: preamble, step block with scheduler reports
+    # printed before each step line, and optionally one more report after
+    # the whitespace line closing the step block
+    rng = random.Random(seed)
+    lines = [f"[0000] [00000.{i:03d}] main: filler line {i}" for i in range(45)]
+    lines.insert(3, f"[0000] [00000.100] main: MPI is up and running with {len(ranks)} node(s).")
+    lines.insert(5, f"[0000] [00000.200] main: {len(ranks)} ranks, 4 threads / rank and 4 task queues / rank")
+    lines.insert(10, "[0000] [00001.000] main: Reading initial conditions took 1234.567 ms.")
+    lines.insert(12, "[0000] [00002.000] main: Running on 4096 gas particles, 0 sink particles.")
+    lines.insert(20, "[0000] [00003.000] space_init: 4096 parts in 64 cells.")
+    lines.append(
+        "#   Step           Time Scale-factor     Redshift      Time-step Time-bins      Updates    g-Updates    "
+        "s-Updates sink-Updates    b-Updates  Wall-clock time [ms]  Props    Dead time [ms]"
+    )
+
+    def report() -> None:
+        for rank in ranks:
+            lines.append(f"[{rank:04d}] [00010.0] scheduler_report_task_times: *** CPU time spent in different task categories:")
+            for category in scheduler_categories:
+                time = rng.random() * 100
+                lines.append(f"[{rank:04d}] [00010.0] scheduler_report_task_times: {category:>16s}: {time:10.3f} ms ({time / 10:6.2f} %)")
+
+    for step in range(num_steps):
+        if reports and step > 0:
+            report()
+        lines.append(
+            f"  {step:6d} {step * 1e-3:14e} {1.0:12.7f} {0.0:12.7f} {1e-3:14e} {1:4d} {56:4d} {4096:12d} {0:12d} "
+            f"{0:12d} {0:12d} {0:12d} {rng.random() * 1000 + 100:21.3f} {0:6d} {rng.random() * 10:21.3f}"
+        )
+    lines.append("  ")
+    if tail_reports:
+        report()
+    lines.append("[0000] [00099.0] main: done")
+
+    with open(path, 'w') as file_handle:
+        file_handle.write('\n'.join(lines) + '\n')
+    return path
+
+
+@pytest.fixture
+def make_log(tmp_path):
+    def make(name: str = 'stdout.out', **kwargs) -> str:
+        return write_log(str(tmp_path / name), **kwargs)
+    return make
@@ -0,0 +1,34 @@
+"""
+Compares the IC loading time parsed from the logs of runs reading the same
+ICs split over different numbers of files (make_ics_3d.py --num-files).
+"""
+import argparse
+from analyse_stdout import Stdout
+
+parser = argparse.ArgumentParser()
+parser.add_argument('logs', type=str, nargs='+',
+                    help="label=log pairs, e.g. 1=single/logs/log_1.out 64=split/logs/log_2.out")
+args = parser.parse_args()
+
+labels = dict()
+for log in args.logs:
+    label, _, path = log.rpartition('=')
+    labels[path] = label if label else path
+
+# Only the header is needed, so the logs are not parsed in full
+stdouts = {path: Stdout(path) for path in labels}
+headers = {path: stdout.header() for path, stdout in stdouts.items()}
+
+reference = None
+print(f"{'Files':>8s} {'Ranks':>6s} {'Particles':>14s} {'IC loading [s]':>15s} {'Particles / s':>14s} {'Speed-up':>9s}")
+for path, header in headers.items():
+    if header.ic_loading_time is None:
+        print(f"{labels[path]:>8s} IC loading time not found in {path}")
+        continue
+
+    loading_time = header.ic_loading_time.to('s').value
+    reference = loading_time if reference is None else reference
+    print((
+        f"{labels[path]:>8s} {header.num_ranks or 0:6d} {header.num_particles or 0:14d} "
+        f"{loading_time:15.3f} {(header.num_particles or 0) / loading_time:14.4e} {reference / loading_time:9.2f}"
+    ))
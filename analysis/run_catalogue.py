@@ -0,0 +1,135 @@
+import os
+import h5py
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from analyse_stdout import Stdout, step_dtype
+from run_index import RunIndex
+
+run_dtype = np.dtype([
+    ('run_name', 'S64'),
+    ('log_path', 'S512'),
+    ('ranks_per_node', np.int64),
+    ('particle_load', np.int64),
+    ('tiling_order', np.int64),
+    ('threads_per_tile', np.int64),
+    ('top_cells_per_tile', np.int64),
+    ('num_particles', np.int64),
+    ('num_ranks', np.int64),
+    ('threads_per_rank', np.int64),
+    ('num_top_level_cells', np.int64),
+    ('ic_loading_time', np.float64),
+    ('step_offset', np.int64),
+    ('step_count', np.int64),
+])
+
+
+def find_runs(root_directory: str) -> List[Dict]:
+
+    # Runs and their latest log, from the (persistent) run index
+    return [
+        {key: run[key] for key in run if key != 'run_directory'}
+        for run in RunIndex(root_directory).records()
+    ]
+
+
+def build_catalogue(
+        root_directory: str,
+        catalogue_path: str,
+        workers: Optional[int] = None,
+        **stdout_kwargs
+) -> str:
+
+    # Crawl the run tree, parse the latest log of every run and write the
+    # run metadata and all the step tables to one HDF5 file:
+    #   /runs           one record per run (run_dtype)
+    #   /steps/<column> the step tables of all runs, concatenated column by
+    #                   column; run i owns rows step_offset:step_offset + step_count
+    #   /steps/run      index of the run each row belongs to
+    runs = find_runs(root_directory)
+    stdouts, failures = Stdout.load_many([run['log_path'] for run in runs], workers=workers, **stdout_kwargs)
+    runs = [run for run in runs if run['log_path'] in stdouts]
+
+    catalogue = np.zeros(len(runs), dtype=run_dtype)
+    step_offset = 0
+    for i, run in enumerate(runs):
+        stdout = stdouts[run['log_path']]
+        for key, value in run.items():
+            catalogue[i][key] = value.encode() if isinstance(value, str) else value
+
+        # Header values missing from the log are stored as -1 and NaN
+        header = stdout.header()
+        for key in ('num_particles', 'num_ranks', 'threads_per_rank', 'num_top_level_cells'):
+            catalogue[i][key] = -1 if getattr(header, key) is None else getattr(header, key)
+        catalogue[i]['ic_loading_time'] = np.nan if header.ic_loading_time is None else header.ic_loading_time.value
+
+        catalogue[i]['step_offset'] = step_offset
+        catalogue[i]['step_count'] = len(stdout.step_block.table)
+        step_offset += catalogue[i]['step_count']
+
+    with h5py.File(catalogue_path, 'w') as catalogue_file:
+        catalogue_file.attrs['root_directory'] = os.path.abspath(root_directory)
+        catalogue_file.attrs['failed_logs'] = [path.encode() for path in failures]
+        catalogue_file.create_dataset('runs', data=catalogue)
+
+        steps = catalogue_file.create_group('steps')
+        chunks = (min(max(step_offset, 1), 65536),)
+        for name in step_dtype.names:
+            steps.create_dataset(
+                name, shape=(step_offset,), dtype=step_dtype[name],
+                chunks=chunks, compression='gzip', shuffle=True
+            )
+        steps.create_dataset('run', shape=(step_offset,), dtype=np.int64, chunks=chunks, compression='gzip')
+
+        for i, run in enumerate(runs):
+            start = catalogue[i]['step_offset']
+            end = start + catalogue[i]['step_count']
+            table = stdouts[run['log_path']].step_block.table.array
+            for name in step_dtype.names:
+                steps[name][start:end] = table[name]
+            steps['run'][start:end] = i
+
+    return catalogue_path
+
+
+class RunCatalogue:
+    # Queries over a catalogue written by build_catalogue. The run records
+    # are small and held in memory; step columns are read from disk only
+    # for the runs and columns asked for.
+
+    def __init__(self, catalogue_path: str):
+        self.catalogue_path = catalogue_path
+        with h5py.File(catalogue_path, 'r') as catalogue_file:
+            self.runs = catalogue_file['runs'][:]
+
+    def select(self, **criteria) -> np.ndarray:
+
+        # Indices of the runs matching all the given field values, e.g.
+        # select(ranks_per_node=4, particle_load=256). Values can be lists.
+        mask = np.ones(len(self.runs), dtype=bool)
+        for field, value in criteria.items():
+            value = [item.encode() if isinstance(item, str) else item for item in np.atleast_1d(value)]
+            mask &= np.isin(self.runs[field], value)
+        return np.flatnonzero(mask)
+
+    def steps(self, run_index: int, columns: Optional[Tuple[str]] = None) -> np.ndarray:
+
+        # Step table of one run, restricted to `columns` if given
+        columns = step_dtype.names if columns is None else columns
+        run = self.runs[run_index]
+        start, end = run['step_offset'], run['step_offset'] + run['step_count']
+        steps = np.empty(end - start, dtype=[(name, step_dtype[name]) for name in columns])
+        with h5py.File(self.catalogue_path, 'r') as catalogue_file:
+            for name in columns:
+                steps[name] = catalogue_file['steps'][name][start:end]
+        return steps
+
+
+if __name__ == '__main__':
+    cwd = '/cosma8/data/dr004/dc-alta2'
+    build_catalogue(cwd, os.path.join(cwd, 'run_catalogue.hdf5'))
+
+    catalogue = RunCatalogue(os.path.join(cwd, 'run_catalogue.hdf5'))
+    for i in catalogue.select(ranks_per_node=4, particle_load=256):
+        run = catalogue.runs[i]
+        steps = catalogue.steps(i, columns=('step', 'wallclock_time'))
+        print(run['run_name'].decode(), run['num_ranks'], len(steps), steps['wallclock_time'].sum())
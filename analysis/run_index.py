@@ -0,0 +1,139 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+
+# Directory layout written by kelvin-helmholtz/setup_run_3d.sh:
+# {R}ranks_node/kh3d_N{particles per tile}_T{tiles}_P{threads per tile}_C{top cells per tile}/logs/log_*.out
+ranks_node_pattern = re.compile(r'^(\d+)ranks_node$')
+run_name_pattern = re.compile(r'^kh3d_N(\d+)_T(\d+)_P(\d+)_C(\d+)$')
+
+RunKey = Tuple[int, int, int, int, int]
+
+
+class RunIndex:
+    # Index of the runs under `root_directory` and of the latest log of each.
+    # Directory listings are cached together with the directory mtime and
+    # persisted to `index_path`, so refresh() only lists the directories
+    # that changed since the last scan (e.g. a logs/ directory that got a
+    # new log) and lookups are plain dictionary accesses.
+
+    def __init__(self, root_directory: str, index_path: Optional[str] = None, refresh: bool = True):
+        self.root_directory = os.path.abspath(root_directory)
+        self.index_path = os.path.join(self.root_directory, '.run_index.json') if index_path is None else index_path
+        self.directories: Dict[str, Dict] = dict()
+        self.runs: Dict[RunKey, Dict] = dict()
+        self.visited = set()
+
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                index = json.load(index_file)
+            if index.get('root_directory') == self.root_directory:
+                self.directories = index['directories']
+
+        if refresh:
+            self.refresh()
+
+    def list_directory(self, path: str) -> Tuple[Dict, bool]:
+
+        # Cached listing of `path`, rescanned only if its mtime changed
+        self.visited.add(path)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.directories.get(path)
+        if cached is not None and cached['mtime'] == mtime:
+            return cached, False
+
+        entries = []
+        latest_log = None
+        latest_ctime = None
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                entries.append(entry.name)
+            elif entry.name.endswith('.out'):
+                ctime = entry.stat().st_ctime
+                if latest_ctime is None or ctime > latest_ctime:
+                    latest_log, latest_ctime = entry.path, ctime
+
+        self.directories[path] = {'mtime': mtime, 'entries': entries, 'latest_log': latest_log}
+        return self.directories[path], True
+
+    def refresh(self) -> None:
+
+        changed = False
+        runs = dict()
+        self.visited = set()
+        root, root_changed = self.list_directory(self.root_directory)
+        changed |= root_changed
+
+        for ranks_node in sorted(root['entries']):
+            ranks_node_match = ranks_node_pattern.match(ranks_node)
+            if ranks_node_match is None:
+                continue
+
+            ranks_node_path = os.path.join(self.root_directory, ranks_node)
+            listing, ranks_node_changed = self.list_directory(ranks_node_path)
+            changed |= ranks_node_changed
+
+            for run_name in sorted(listing['entries']):
+                run_match = run_name_pattern.match(run_name)
+                if run_match is None:
+                    continue
+
+                # Run directories come from the is_dir() of scandir; their
+                # logs/ directory is only stat'ed once, by list_directory()
+                try:
+                    logs, logs_changed = self.list_directory(os.path.join(ranks_node_path, run_name, 'logs'))
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                changed |= logs_changed
+                if logs['latest_log'] is None:
+                    continue
+
+                key = (int(ranks_node_match.group(1)), *(int(group) for group in run_match.groups()))
+                runs[key] = {
+                    'run_name': run_name,
+                    'run_directory': os.path.join(ranks_node_path, run_name),
+                    'log_path': logs['latest_log'],
+                    'ranks_per_node': key[0],
+                    'particle_load': key[1],
+                    'tiling_order': key[2],
+                    'threads_per_tile': key[3],
+                    'top_cells_per_tile': key[4],
+                }
+
+        # Forget directories that are no longer part of the tree
+        for path in set(self.directories) - self.visited:
+            del self.directories[path]
+            changed = True
+
+        self.runs = runs
+        if changed or not os.path.isfile(self.index_path):
+            self.save()
+
+    def save(self) -> None:
+        temporary_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as index_file:
+            json.dump({'root_directory': self.root_directory, 'directories': self.directories}, index_file)
+        os.replace(temporary_path, self.index_path)
+
+    def records(self) -> List[Dict]:
+        return [self.runs[key] for key in sorted(self.runs)]
+
+    def lookup(
+            self,
+            ranks_per_node: int,
+            particle_load: int,
+            tiling_order: int,
+            threads_per_tile: int,
+            top_cells_per_tile: int = 4
+    ) -> str:
+
+        # Latest log of the run. The index is refreshed once on a miss, in
+        # case the run was set up after the last scan.
+        key = (int(ranks_per_node), int(particle_load), int(tiling_order), int(threads_per_tile),
+               int(top_cells_per_tile))
+        if key not in self.runs:
+            self.refresh()
+        if key not in self.runs:
+            raise FileNotFoundError(f"No run with logs found for (R, N, T, P, C) = {key} in {self.root_directory}")
+        return self.runs[key]['log_path']
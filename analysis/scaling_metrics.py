@@ -0,0 +1,199 @@
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from unyt import unyt_array
+from analyse_stdout import Stdout
+
+# Scaling metrics of a set of runs. All functions take arrays whose last
+# axis runs over the runs of a scaling sweep (or over steps, ranks, ...)
+# and any number of leading axes, so several sweeps are evaluated in one
+# call. Missing values are NaN and are ignored by the reductions and fits.
+
+
+def nan_mean(values: np.ndarray, axis: int = -1) -> np.ndarray:
+
+    # Mean ignoring NaN, NaN where all values are missing (without the
+    # RuntimeWarning of np.nanmean)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, values, 0.).sum(axis=axis) / valid.sum(axis=axis)
+
+
+def reference_values(values: np.ndarray, reference: int = 0) -> np.ndarray:
+    return np.take(values, [reference], axis=-1)
+
+
+def speedup(times: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Speed-up relative to the run at index `reference` of the last axis
+    times = np.asarray(times, dtype=float)
+    return reference_values(times, reference) / times
+
+
+def strong_efficiency(times: np.ndarray, cores: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Fixed problem size: E = (t_ref * p_ref) / (t * p)
+    times = np.asarray(times, dtype=float)
+    cores = np.broadcast_to(np.asarray(cores, dtype=float), times.shape)
+    return reference_values(times * cores, reference) / (times * cores)
+
+
+def weak_efficiency(times: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Fixed problem size per core: E = t_ref / t
+    return speedup(times, reference)
+
+
+def karp_flatt(speedups: np.ndarray, cores: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Experimentally determined serial fraction, e = (1/S - 1/p) / (1 - 1/p),
+    # with p the number of cores relative to the reference run. It is NaN
+    # for the reference run itself.
+    speedups = np.asarray(speedups, dtype=float)
+    cores = np.broadcast_to(np.asarray(cores, dtype=float), speedups.shape)
+    relative_cores = cores / reference_values(cores, reference)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        serial_fraction = (1. / speedups - 1. / relative_cores) / (1. - 1. / relative_cores)
+    return np.where(relative_cores == 1., np.nan, serial_fraction)
+
+
+def least_squares_slope(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+
+    # Slope of y = f * x through the origin along the last axis
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = np.where(valid, x, 0.)
+    y = np.where(valid, y, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x * y).sum(axis=-1) / (x * x).sum(axis=-1)
+
+
+def fit_amdahl(speedups: np.ndarray, cores: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Serial fraction f of Amdahl's law, S = 1 / (f + (1 - f) / p), fitted
+    # to the strong scaling speed-ups. The law is linear in f for 1/S:
+    # 1/S - 1/p = f * (1 - 1/p).
+    speedups = np.asarray(speedups, dtype=float)
+    cores = np.broadcast_to(np.asarray(cores, dtype=float), speedups.shape)
+    relative_cores = cores / reference_values(cores, reference)
+    return least_squares_slope(1. - 1. / relative_cores, 1. / speedups - 1. / relative_cores)
+
+
+def fit_gustafson(scaled_speedups: np.ndarray, cores: np.ndarray, reference: int = 0) -> np.ndarray:
+
+    # Serial fraction f of Gustafson's law, S = p - f * (p - 1), fitted to
+    # the weak scaling (scaled) speed-ups, S = p * t_ref / t
+    scaled_speedups = np.asarray(scaled_speedups, dtype=float)
+    cores = np.broadcast_to(np.asarray(cores, dtype=float), scaled_speedups.shape)
+    relative_cores = cores / reference_values(cores, reference)
+    return least_squares_slope(relative_cores - 1., relative_cores - scaled_speedups)
+
+
+def amdahl_speedup(serial_fraction: np.ndarray, cores: np.ndarray) -> np.ndarray:
+    serial_fraction = np.asarray(serial_fraction, dtype=float)[..., np.newaxis]
+    return 1. / (serial_fraction + (1. - serial_fraction) / np.asarray(cores, dtype=float))
+
+
+def gustafson_speedup(serial_fraction: np.ndarray, cores: np.ndarray) -> np.ndarray:
+    serial_fraction = np.asarray(serial_fraction, dtype=float)[..., np.newaxis]
+    cores = np.asarray(cores, dtype=float)
+    return cores - serial_fraction * (cores - 1.)
+
+
+def time_per_particle_update(times: np.ndarray, cores: np.ndarray, updates: np.ndarray) -> np.ndarray:
+
+    # Core-time spent per particle update, in the units of `times`
+    return np.asarray(times) * np.asarray(cores, dtype=float) / np.asarray(updates, dtype=float)
+
+
+def load_imbalance(times: np.ndarray, rank_axis: int = -2) -> np.ndarray:
+
+    # Max over mean across ranks, e.g. of the (steps, ranks, categories)
+    # scheduler report series. 1 is perfect balance, NaN without ranks.
+    times = np.asarray(times, dtype=float)
+    if times.shape[rank_axis] == 0:
+        return np.full(np.delete(times.shape, rank_axis % times.ndim), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.fmax.reduce(times, axis=rank_axis) / nan_mean(times, axis=rank_axis)
+
+
+def dead_time_fraction(
+        times: np.ndarray,
+        categories: List[str],
+        dead_time: str = 'dead_time',
+        total: str = 'total'
+) -> np.ndarray:
+
+    # Dead time over total time of the scheduler report series, with the
+    # categories along the last axis
+    times = np.asarray(times, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return times[..., categories.index(dead_time)] / times[..., categories.index(total)]
+
+
+def run_metrics(
+        stdouts: List[Stdout],
+        steps: Optional[List[np.ndarray]] = None
+) -> Dict[str, np.ndarray]:
+
+    # Per-run quantities of a scaling sweep, as arrays over the runs. Step
+    # times are averaged over `steps[i]` (all steps if None), e.g. the
+    # clean steps common to all runs. The scheduler report metrics are
+    # averaged over the same steps, where reported.
+    metrics = {
+        'num_particles': np.empty(len(stdouts)),
+        'num_ranks': np.empty(len(stdouts)),
+        'cores': np.empty(len(stdouts)),
+        'times_mean': np.empty(len(stdouts)),
+        'times_std': np.empty(len(stdouts)),
+        'updates_mean': np.empty(len(stdouts)),
+        'load_imbalance': np.empty(len(stdouts)),
+        'dead_time_fraction': np.empty(len(stdouts)),
+    }
+
+    for i, stdout in enumerate(stdouts):
+        step_table = stdout.step_table()
+        if steps is not None:
+            step_table = step_table[np.asarray(steps[i], dtype=np.int64)]
+
+        metrics['num_particles'][i] = stdout.num_particles()
+        metrics['num_ranks'][i] = stdout.num_ranks()
+        metrics['cores'][i] = stdout.num_ranks() * stdout.threads_per_rank()
+        metrics['times_mean'][i] = step_table['wallclock_time'].mean() if len(step_table) > 0 else np.nan
+        metrics['times_std'][i] = step_table['wallclock_time'].std() if len(step_table) > 0 else np.nan
+        metrics['updates_mean'][i] = step_table['updates'].mean() if len(step_table) > 0 else np.nan
+
+        # Logs without scheduler reports have no imbalance metrics
+        report_steps, _, categories, report_times = stdout.scheduler_report_series()
+        report_times = report_times.value[np.isin(report_steps, step_table['step'])]
+        if report_times.size == 0 or 'total' not in categories or 'dead_time' not in categories:
+            metrics['load_imbalance'][i] = np.nan
+            metrics['dead_time_fraction'][i] = np.nan
+            continue
+
+        total = report_times[..., categories.index('total')]
+        metrics['load_imbalance'][i] = nan_mean(load_imbalance(total, rank_axis=-1).ravel())
+        metrics['dead_time_fraction'][i] = nan_mean(dead_time_fraction(report_times, categories).ravel())
+
+    metrics['times_mean'] = unyt_array(metrics['times_mean'], 'ms')
+    metrics['times_std'] = unyt_array(metrics['times_std'], 'ms')
+    metrics['time_per_update'] = time_per_particle_update(
+        metrics['times_mean'], metrics['cores'], metrics['num_particles']
+    )
+
+    return metrics
+
+
+def scaling_summary(metrics: Dict[str, np.ndarray], reference: int = 0) -> Dict[str, np.ndarray]:
+
+    # Strong and weak scaling metrics of the runs in `metrics` (from
+    # run_metrics), relative to run `reference`
+    times = np.asarray(metrics['times_mean'])
+    cores = metrics['cores']
+    strong_speedup = speedup(times, reference)
+    scaled_speedup = weak_efficiency(times, reference) * cores / cores[reference]
+    return {
+        'strong_efficiency': strong_efficiency(times, cores, reference),
+        'weak_efficiency': weak_efficiency(times, reference),
+        'karp_flatt': karp_flatt(strong_speedup, cores, reference),
+        'amdahl_serial_fraction': fit_amdahl(strong_speedup, cores, reference),
+        'gustafson_serial_fraction': fit_gustafson(scaled_speedup, cores, reference),
+    }
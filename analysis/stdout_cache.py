@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Optional, Dict
+
+# Number of bytes hashed at each end of the log to fingerprint its content
+fingerprint_size = 1024 ** 2
+
+
+class StdoutCache:
+    # Persistent cache of parsed Stdout logs. Each log is stored as one .npz
+    # file holding the step table, the header values and the scheduler
+    # report, keyed by the path, size, mtime and a content fingerprint of the
+    # log. A job that is still running changes the size and mtime of its log,
+    # so its entry is reparsed on the next access. Entries are evicted in
+    # least-recently-used order once the cache exceeds `max_size` bytes.
+
+    def __init__(self, cache_directory: Optional[str] = None, max_size: int = 2 * 1024 ** 3):
+        if cache_directory is None:
+            cache_directory = os.path.join(os.path.expanduser('~'), '.cache', 'exascale-hydro', 'stdout')
+        os.makedirs(cache_directory, exist_ok=True)
+        self.cache_directory = cache_directory
+        self.max_size = max_size
+
+    def entry_path(self, stdout_file_path: str) -> str:
+        name = hashlib.blake2b(os.path.abspath(stdout_file_path).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_directory, f'{name}.npz')
+
+    @staticmethod
+    def key(stdout_file_path: str, header: int) -> Dict:
+
+        stat = os.stat(stdout_file_path)
+        content_hash = hashlib.blake2b(str(stat.st_size).encode(), digest_size=16)
+        with open(stdout_file_path, 'rb') as file_handle:
+            content_hash.update(file_handle.read(fingerprint_size))
+            if stat.st_size > fingerprint_size:
+                file_handle.seek(max(stat.st_size - fingerprint_size, fingerprint_size))
+                content_hash.update(file_handle.read(fingerprint_size))
+
+        return {
+            'path': os.path.abspath(stdout_file_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'content_hash': content_hash.hexdigest(),
+            'header': header,
+        }
+
+    def load(self, stdout, key: Dict) -> bool:
+
+        # Fill in the parsed state of `stdout` from the cache. Returns False
+        # if there is no entry matching `key`, the current state of the log.
+        entry_path = self.entry_path(stdout.stdout_file_path)
+        if not os.path.isfile(entry_path):
+            return False
+
+        try:
+            with np.load(entry_path) as entry:
+                if json.loads(str(entry['key'])) != key:
+                    return False
+
+                stdout.restore(
+                    header_values=json.loads(str(entry['header_values'])),
+                    step_table=entry['step_table'],
+                    scheduler_reports=entry['scheduler_reports'],
+                    header=key['header']
+                )
+        except (OSError, ValueError, KeyError):
+            return False
+
+        # Mark as recently used
+        os.utime(entry_path)
+        return True
+
+    def store(self, stdout, key: Dict) -> None:
+
+        # `key` must be taken before parsing, so that lines appended while
+        # the log was being parsed invalidate the entry
+
+        entry_path = self.entry_path(stdout.stdout_file_path)
+        temporary_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file_handle:
+            np.savez(
+                file_handle,
+                key=np.array(json.dumps(key)),
+                header_values=np.array(json.dumps(stdout.header_values)),
+                step_table=stdout.step_block.table.array,
+                scheduler_reports=stdout.scheduler_report.table.array
+            )
+        os.replace(temporary_path, entry_path)
+        self.evict()
+
+    def evict(self) -> None:
+
+        # Remove the least recently used entries until the cache fits in max_size
+        entries = []
+        for entry in os.scandir(self.cache_directory):
+            if entry.name.endswith('.npz') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.cache_directory):
+            if entry.name.endswith('.npz'):
+                os.remove(entry.path)
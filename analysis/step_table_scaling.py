@@ -0,0 +1,58 @@
+"""
+Times the parsing of synthetic step blocks of increasing length, to check
+that building the step table scales linearly with the number of steps.
+"""
+import argparse
+from time import perf_counter
+import numpy as np
+from analyse_stdout import StepBlockMatcher
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-m', '--max-steps', type=int, default=10 ** 7, required=False)
+parser.add_argument('-a', '--compare-append', action='store_true', default=False, required=False)
+args = parser.parse_args()
+
+
+def step_line(step: int) -> str:
+    return (
+        f"  {step:6d} {step * 1e-3:14e} {1.0:12.7f} {0.0:12.7f} {1e-3:14e} {1:4d} {56:4d} "
+        f"{16777216:12d} {0:12d} {0:12d} {0:12d} {0:12d} {123.456:21.3f} {0:6d} {1.234:21.3f}"
+    )
+
+
+def time_step_table(num_steps: int) -> float:
+    matcher = StepBlockMatcher('synthetic', header=0)
+    matcher.feed('#   Step', 0)
+    tic = perf_counter()
+    for step in range(num_steps):
+        matcher.feed(step_line(step), step + 1)
+    # Flush the last batch of step lines into the table
+    matcher.close()
+    toc = perf_counter()
+    assert len(matcher.table) == num_steps
+    return toc - tic
+
+
+def time_np_append(num_steps: int) -> float:
+    # The per-step np.append used by the previous implementation
+    timestep_number = np.empty(0, dtype=int)
+    tic = perf_counter()
+    for step in range(num_steps):
+        line = step_line(step).split()
+        timestep_number = np.append(timestep_number, int(line[0]))
+    toc = perf_counter()
+    return toc - tic
+
+
+num_steps = 10 ** np.arange(3, int(np.log10(args.max_steps)) + 1)
+
+print(f"{'Steps':>10s} {'Time [s]':>10s} {'Time / step [us]':>18s}")
+for n in num_steps:
+    elapsed = time_step_table(int(n))
+    print(f"{n:10d} {elapsed:10.3f} {elapsed / n * 1e6:18.3f}")
+
+if args.compare_append:
+    print('np.append (previous implementation)')
+    for n in num_steps[num_steps <= 10 ** 5]:
+        elapsed = time_np_append(int(n))
+        print(f"{n:10d} {elapsed:10.3f} {elapsed / n * 1e6:18.3f}")
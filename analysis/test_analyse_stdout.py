@@ -0,0 +1,36 @@
+import numpy as np
+from analyse_stdout import Stdout
+
+
+def parsed_state(path: str, use_mmap: bool):
+    stdout = Stdout(path, use_mmap=use_mmap)
+    stdout.parse()
+    state = (stdout.step_table(), stdout.scheduler_report.table.array, stdout.parser.offset)
+    stdout.close()
+    return state
+
+
+def test_mmap_parse_matches_line_parse(make_log):
+    path = make_log(ranks=(0, 1), tail_reports=True)
+    step_table, reports, offset = parsed_state(path, use_mmap=False)
+    mmap_step_table, mmap_reports, mmap_offset = parsed_state(path, use_mmap=True)
+
+    assert np.array_equal(step_table, mmap_step_table)
+    assert np.array_equal(reports, mmap_reports)
+    assert offset == mmap_offset
+
+    # The reports after the step block are kept by both
+    assert np.count_nonzero(reports['step'] == -1) > 0
+
+
+def test_scheduler_report_task_times_is_rank_0(make_log):
+    path = make_log(ranks=(0, 1, 2))
+    stdout = Stdout(path)
+    task_times = stdout.scheduler_report_task_times()
+    steps, ranks, categories, times = stdout.scheduler_report_series()
+
+    # One value per reported step, those of rank 0 divided by the threads
+    rank = list(ranks).index(0)
+    for c, category in enumerate(categories):
+        assert len(task_times[category]) == len(steps)
+        assert np.allclose(task_times[category].value, times.value[:, rank, c] / stdout.threads_per_rank())
@@ -0,0 +1,19 @@
+import numpy as np
+from analyse_stdout import Stdout
+from scaling_metrics import load_imbalance, run_metrics
+
+
+def test_load_imbalance_without_ranks():
+    assert np.all(np.isnan(load_imbalance(np.empty((4, 0)), rank_axis=-1)))
+    assert load_imbalance(np.empty((4, 0)), rank_axis=-1).shape == (4,)
+    assert load_imbalance(np.empty((0, 0, 18))).shape == (0, 18)
+
+
+def test_run_metrics_without_scheduler_reports(make_log):
+    with_reports = Stdout(make_log('reports.out', ranks=(0, 1)))
+    without_reports = Stdout(make_log('plain.out', ranks=(0, 1), reports=False))
+    metrics = run_metrics([with_reports, without_reports])
+
+    assert np.all(np.isfinite(metrics['times_mean']))
+    assert np.isfinite(metrics['load_imbalance'][0]) and np.isfinite(metrics['dead_time_fraction'][0])
+    assert np.isnan(metrics['load_imbalance'][1]) and np.isnan(metrics['dead_time_fraction'][1])
@@ -2,6 +2,10 @@ import os.path
 import numpy as np
 import matplotlib.pyplot as plt
 from analyse_stdout import Stdout
+from stdout_cache import StdoutCache
+from run_index import RunIndex
+from scaling_metrics import run_metrics
+from clean_steps import CleanStepRules, align_runs
 
 plt.style.use('../mnras.mplstyle')
 
@@ -10,30 +14,16 @@ threads_per_node = 128
 __particle_load = 256
 __ranks_per_node = 4
 plot_annotations = False
+parsing_workers = 8
+stdout_cache = StdoutCache()
+run_index = RunIndex(cwd)
+clean_step_rules = CleanStepRules()
 
 
 def get_stdout_path(
         ranks_per_node: int, particle_load: int, tiling_order: int, threads_per_rank: int
 ):
-    ranks_per_node = int(ranks_per_node)
-    particle_load = int(particle_load)
-    tiling_order = int(tiling_order)
-    threads_per_rank = int(threads_per_rank)
-
-    log_directory = os.path.join(
-        cwd,
-        f'{ranks_per_node}ranks_node',
-        f'kh3d_N{particle_load}_T{tiling_order}_P{threads_per_rank}_C4',
-        'logs'
-    )
-    log_stdouts = [file for file in os.listdir(log_directory) if file.endswith('.out')]
-    log_stdouts = [os.path.join(log_directory, file) for file in log_stdouts]
-    latest_file = max(
-        log_stdouts,
-        key=os.path.getctime
-    )
-
-    return latest_file
+    return run_index.lookup(ranks_per_node, particle_load, tiling_order, threads_per_rank, top_cells_per_tile=4)
 
 
 tiling_orders = {
@@ -65,63 +55,25 @@ for __ranks_per_node in [2, 4, 8]:
             __ranks_per_node, __particle_load, t, threads_per_node / __ranks_per_node
         ))
 
-    good_timesteps = []
-    no_clean_steps = []
-    for i, log in enumerate(logs):
-        print(log)
-        test = Stdout(os.path.join(cwd, log))
-        timestep_number, particle_updates, timestep_duration, timestep_properties = test.analyse_stdout()
-
-        if len(timestep_number) > 0:
-            is_clean = np.logical_and(
-                timestep_properties == 0,
-                particle_updates == particle_updates[0]
-            )
-
-            if len(timestep_number[is_clean]) > 0:
-                good_timesteps.append(
-                    list(timestep_number[is_clean])
-                )
-            else:
-                no_clean_steps.append(log)
-
-        else:
-            no_clean_steps.append(log)
+    # Parse all the logs of this configuration in parallel
+    stdouts, failed_logs = Stdout.load_many(logs, workers=parsing_workers, cache=stdout_cache)
 
-    common_timesteps = list(set(good_timesteps[0]).intersection(*good_timesteps[1:]))
-    common_timesteps = np.asarray(common_timesteps)
+    # Clean steps common to all the runs of this configuration
+    common_timesteps, logs, no_clean_steps = align_runs(
+        {log: stdouts[log].step_table() for log in stdouts}, clean_step_rules
+    )
+    no_clean_steps = list(failed_logs) + no_clean_steps
     print('common timesteps', common_timesteps)
 
     print('runs with no clean timesteps:', no_clean_steps)
-    logs = [log for log in logs if log not in no_clean_steps]
-
-    particles = np.empty(len(logs))
-    ranks = np.empty(len(logs))
-    threads = np.empty(len(logs))
-    times_mean = np.empty(len(logs))
-    times_std = np.empty(len(logs))
-    time_per_update = np.empty(len(logs))
-
-    for i, log in enumerate(logs):
-        test = Stdout(os.path.join(cwd, log))
-
-        particles[i] = test.num_particles()
-        ranks[i] = test.num_ranks()
-        threads[i] = test.num_ranks() * test.threads_per_rank()
-
-        timestep_number, particle_updates, timestep_duration, timestep_properties = test.analyse_stdout()
-        timestep_number = timestep_number[common_timesteps]
-        particle_updates = particle_updates[common_timesteps]
-        timestep_duration = timestep_duration[common_timesteps]
-        timestep_properties = timestep_properties[common_timesteps]
-
-        is_clean = np.logical_and(
-            timestep_properties == 0,
-            particle_updates == particle_updates[0],
-        )
-        times_mean[i] = timestep_duration[is_clean].mean().to('microsecond')
-        times_std[i] = timestep_duration[is_clean].std().to('microsecond')
-        time_per_update[i] = times_mean[i] * threads[i] / particles[i]  # micro-second
+
+    metrics = run_metrics([stdouts[log] for log in logs], steps=[common_timesteps] * len(logs))
+    particles = metrics['num_particles']
+    ranks = metrics['num_ranks']
+    threads = metrics['cores']
+    times_mean = metrics['times_mean'].to('microsecond').value
+    times_std = metrics['times_std'].to('microsecond').value
+    time_per_update = metrics['time_per_update'].to('microsecond').value
 
     print('particles', particles)
     print('ranks', ranks)
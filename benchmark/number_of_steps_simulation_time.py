@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from swiftsimio import load
 from glob import glob
+from timesteps import read_timesteps
 import os
 
 
@@ -28,11 +29,9 @@ def number_of_steps_simulation_time(
     timesteps_filename = timesteps_glob[0]
 
     snapshot = load(snap_filepath_zoom)
-    data = np.genfromtxt(
-        timesteps_filename, skip_footer=5, loose=True, invalid_raise=False
-    ).T
+    data = read_timesteps(timesteps_filename, usecols=(1,))
 
-    sim_time = unyt.unyt_array(data[1], units=snapshot.units.time).to("Gyr")
+    sim_time = unyt.unyt_array(data[0], units=snapshot.units.time).to("Gyr")
     number_of_steps = np.arange(sim_time.size) / 1e6
 
     fig, ax = plt.subplots()
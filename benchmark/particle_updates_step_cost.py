@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import LogNorm
 from glob import glob
+from timesteps import read_timesteps
 import os
 
 try:
@@ -29,12 +30,10 @@ def particle_updates_step_cost(
     number_of_updates_bins = unyt.unyt_array(np.logspace(0, 10, 512), units="dimensionless")
     wallclock_time_bins = unyt.unyt_array(np.logspace(0, 6, 512), units="ms")
 
-    data = np.genfromtxt(
-        timesteps_filename, skip_footer=5, loose=True, invalid_raise=False
-    ).T
+    data = read_timesteps(timesteps_filename, usecols=(8, -2))
 
-    number_of_updates = unyt.unyt_array(data[8], units="dimensionless")
-    wallclock_time = unyt.unyt_array(data[-2], units="ms")
+    number_of_updates = unyt.unyt_array(data[0], units="dimensionless")
+    wallclock_time = unyt.unyt_array(data[1], units="ms")
 
     fig, ax = plt.subplots()
     ax.loglog()
@@ -0,0 +1,169 @@
+"""
+Memory-mapped reader for the timesteps_*.txt files written by SWIFT.
+"""
+import mmap
+from os.path import getsize
+import numpy as np
+from typing import Optional, Tuple, List, Iterator
+
+
+def parse_timesteps_lines(lines: List[str], number_columns: Optional[int]) -> np.ndarray:
+    # Line-by-line fallback, used when np.loadtxt cannot convert a chunk.
+    # Like np.genfromtxt(loose=True, invalid_raise=False), lines with the
+    # wrong number of columns are skipped and unreadable values become NaN.
+    rows = []
+    for line in lines:
+        line = line.split('#')[0].split()
+        if len(line) == 0:
+            continue
+        if number_columns is None:
+            number_columns = len(line)
+        if len(line) != number_columns:
+            continue
+
+        row = np.empty(number_columns)
+        for i, value in enumerate(line):
+            try:
+                row[i] = float(value)
+            except ValueError:
+                row[i] = np.nan
+        rows.append(row)
+
+    if len(rows) == 0:
+        return np.empty((0, 0 if number_columns is None else number_columns))
+
+    return np.vstack(rows)
+
+
+def iter_timesteps_blocks(
+        buffer: mmap.mmap,
+        start: int,
+        end: int,
+        chunk_size: int,
+        number_columns: Optional[int] = None
+) -> Iterator[np.ndarray]:
+    # Converts the lines between the byte offsets `start` and `end` one chunk
+    # at a time, yielding the non-empty (rows, columns) blocks
+    position = start
+    while position < end:
+        stop = buffer.find(b'\n', min(position + chunk_size, end), end)
+        stop = end if stop < 0 else stop + 1
+        lines = buffer[position:stop].decode(errors='replace').splitlines()
+        position = stop
+
+        try:
+            values = np.loadtxt(lines, ndmin=2, comments='#')
+            if values.size > 0 and number_columns is not None and values.shape[1] != number_columns:
+                raise ValueError
+        except ValueError:
+            values = parse_timesteps_lines(lines, number_columns)
+
+        if values.size == 0:
+            continue
+
+        number_columns = values.shape[1]
+        yield values
+
+
+def read_timesteps(
+        timesteps_filename: str,
+        usecols: Optional[Tuple[int]] = None,
+        skip_footer: int = 5,
+        chunk_size: int = 64 * 1024 ** 2
+) -> np.ndarray:
+    # Returns the columns of the file as rows, like np.genfromtxt(...).T.
+    # The file is memory-mapped and converted one chunk of lines at a time,
+    # so only the requested columns are ever held in memory in full.
+    blocks = []
+
+    with open(timesteps_filename, 'rb') as file_handle:
+        with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+
+            # Drop the last `skip_footer` lines
+            end = len(buffer)
+            if end > 0 and buffer[end - 1] == ord('\n'):
+                end -= 1
+            for _ in range(skip_footer):
+                end = max(buffer.rfind(b'\n', 0, end), 0)
+
+            for values in iter_timesteps_blocks(buffer, 0, end, chunk_size):
+                blocks.append(values if usecols is None else values[:, usecols])
+
+    if len(blocks) == 0:
+        return np.empty((0, 0))
+
+    return np.concatenate(blocks).T
+
+
+class Timesteps:
+    # Incremental reader for the timesteps file of a running job. Each call to
+    # refresh() converts only the complete lines appended since the previous
+    # call and adds them to a buffer whose capacity doubles when full. A file
+    # shorter than the bytes already read (truncated, or recreated by a
+    # restart) is reread from the start. `data` is a view of the buffer: an
+    # append that grows the buffer leaves the views taken before it stale.
+
+    def __init__(
+            self,
+            timesteps_filename: str,
+            usecols: Optional[Tuple[int]] = None,
+            chunk_size: int = 64 * 1024 ** 2
+    ):
+        self.timesteps_filename = timesteps_filename
+        self.usecols = usecols
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.number_columns: Optional[int] = None
+        self._buffer: Optional[np.ndarray] = None
+        self.size = 0
+        self.refresh()
+
+    @property
+    def data(self) -> np.ndarray:
+        # Columns as rows, like read_timesteps. This is a view of the buffer.
+        if self._buffer is None:
+            return np.empty((0, 0))
+        return self._buffer[:self.size].T
+
+    def append(self, values: np.ndarray) -> None:
+        if self.usecols is not None:
+            values = values[:, self.usecols]
+        if self._buffer is None:
+            self._buffer = np.empty((max(len(values), 1024), values.shape[1]))
+        elif self.size + len(values) > len(self._buffer):
+            buffer = np.empty((max(self.size + len(values), 2 * len(self._buffer)), self._buffer.shape[1]))
+            buffer[:self.size] = self._buffer[:self.size]
+            self._buffer = buffer
+        self._buffer[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def refresh(self) -> int:
+
+        # Returns the number of new rows, all of them after a reread
+        file_size = getsize(self.timesteps_filename)
+        if file_size < self.offset:
+            self.offset = 0
+            self.size = 0
+            self._buffer = None
+            self.number_columns = None
+        size = self.size
+        if file_size <= self.offset:
+            return 0
+
+        with open(self.timesteps_filename, 'rb') as file_handle:
+            with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+
+                # Leave an incomplete last line for the next refresh
+                end = buffer.rfind(b'\n', self.offset) + 1
+                if end <= self.offset:
+                    return 0
+
+                for values in iter_timesteps_blocks(
+                        buffer, self.offset, end, self.chunk_size, self.number_columns
+                ):
+                    self.number_columns = values.shape[1]
+                    self.append(values)
+
+                self.offset = end
+
+        return self.size - size
@@ -8,6 +8,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from glob import glob
+from timesteps import read_timesteps
 try:
     plt.style.use("../mnras.mplstyle")
 except:
@@ -23,11 +24,9 @@ def wallclock_number_of_steps(
     timesteps_glob = glob(f"{run_directory}/timesteps_*.txt")
     timesteps_filename = timesteps_glob[0]
 
-    data = np.genfromtxt(
-        timesteps_filename, skip_footer=5, loose=True, invalid_raise=False
-    ).T
+    data = read_timesteps(timesteps_filename, usecols=(-2,))
 
-    wallclock_time = unyt.unyt_array(np.cumsum(data[-2]), units="ms").to("Hour")
+    wallclock_time = unyt.unyt_array(np.cumsum(data[0]), units="ms").to("Hour")
     number_of_steps = np.arange(wallclock_time.size) / 1e6
 
     fig, ax = plt.subplots()
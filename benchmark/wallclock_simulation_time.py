@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from swiftsimio import load
 from glob import glob
+from timesteps import read_timesteps
 import os
 
 
@@ -27,12 +28,10 @@ def wallclock_simulation_time(
     timesteps_filename = timesteps_glob[0]
 
     snapshot = load(snap_filepath_zoom)
-    data = np.genfromtxt(
-        timesteps_filename, skip_footer=5, loose=True, invalid_raise=False
-    ).T
+    data = read_timesteps(timesteps_filename, usecols=(1, -2))
     
-    sim_time = unyt.unyt_array(data[1], units=snapshot.units.time).to("Gyr")
-    wallclock_time = unyt.unyt_array(np.cumsum(data[-2]), units="ms").to("Hour")
+    sim_time = unyt.unyt_array(data[0], units=snapshot.units.time).to("Gyr")
+    wallclock_time = unyt.unyt_array(np.cumsum(data[1]), units="ms").to("Hour")
     
     fig, ax = plt.subplots()
     
@@ -4,6 +4,11 @@ import os
 import argparse
 from matplotlib import pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from ic_slabs import memory_budget_bytes
+from ic_validate import validate_ic_file, check_statistics, chunk_row_bytes
+from cell_load import imbalance_statistics, cell_counts
+from ic_cells import read_cell_index, cell_ids, cell_ranges, read_cells
+from voxel_render import draw_grid, checkerboard_colors
 
 plt.style.use('../mnras.mplstyle')
 
@@ -11,6 +16,12 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-i', '--ic-file', type=str, required=True)
 parser.add_argument('-t', '--top-cells-per-tile', type=int, default=3, required=False)
 parser.add_argument('-o', '--outdir', type=str, default='.', required=False)
+parser.add_argument('-n', '--nparticles', type=int, default=None, required=False,
+                    help="Check the file against make_ics_3d.py -n NPARTICLES")
+parser.add_argument('-w', '--workers', type=int, default=4, required=False)
+parser.add_argument('-m', '--memory-budget-mb', type=float, default=None, required=False)
+parser.add_argument('--validate', action='store_true', default=False, required=False,
+                    help="Stream and validate all the particles even if the file has a /Cells index")
 args = parser.parse_args()
 
 
@@ -21,45 +32,42 @@ def logger_info(category: str, length: int = 12) -> str:
     return f"[{category}]" + ' ' * num_blanks
 
 
-def cuboid_data(o, size=(1, 1, 1)):
-    # code taken from
-    # https://stackoverflow.com/a/35978146/4124317
-    # suppose axis direction: x: to left; y: to inside; z: to upper
-    # get the length, width, and height
-    l, w, h = size
-    x = [[o[0], o[0] + l, o[0] + l, o[0], o[0]],
-         [o[0], o[0] + l, o[0] + l, o[0], o[0]],
-         [o[0], o[0] + l, o[0] + l, o[0], o[0]],
-         [o[0], o[0] + l, o[0] + l, o[0], o[0]]]
-    y = [[o[1], o[1], o[1] + w, o[1] + w, o[1]],
-         [o[1], o[1], o[1] + w, o[1] + w, o[1]],
-         [o[1], o[1], o[1], o[1], o[1]],
-         [o[1] + w, o[1] + w, o[1] + w, o[1] + w, o[1] + w]]
-    z = [[o[2], o[2], o[2], o[2], o[2]],
-         [o[2] + h, o[2] + h, o[2] + h, o[2] + h, o[2] + h],
-         [o[2], o[2], o[2] + h, o[2] + h, o[2]],
-         [o[2], o[2], o[2] + h, o[2] + h, o[2]]]
-    return np.array(x), np.array(y), np.array(z)
-
-
-def plotCubeAt(pos=(0, 0, 0), size=(1, 1, 1), ax=None, **kwargs):
-    # Plotting a cube element at position pos
-    if ax != None:
-        X, Y, Z = cuboid_data(pos, size)
-        ax.plot_surface(X, Y, Z, rstride=1, cstride=1, **kwargs)
-
-
 with h5py.File(args.ic_file, 'r') as ic_data:
-    coords = ic_data['/PartType0/Coordinates'][:]
     boxsize = ic_data['/Header'].attrs["BoxSize"]
     num_particles = ic_data['/Header'].attrs["NumPart_Total"][0]
+    has_cell_index = '/Cells' in ic_data
 
 print(f"{logger_info('ICs file')} Analysing 3D initial conditions file: {args.ic_file}")
 print(f"{logger_info('ICs file')} Box size: {boxsize}")
 print(f"{logger_info('ICs file')} Total number of gas particles: {num_particles}")
 
-# Retrieve the number of stacked layers from z-coordinates
-num_2dlayers = len(np.unique(coords[:, 2]))
+# Stream the particles in chunks, one per worker at a time within the budget
+chunk_rows = memory_budget_bytes(args.memory_budget_mb) // ((args.workers + 1) * chunk_row_bytes)
+cdim = args.top_cells_per_tile * int(boxsize[0])
+checks = []
+
+if has_cell_index and not args.validate:
+
+    # With a /Cells index, only the column of cells at x = y = 0 is read:
+    # every layer of the lattice spans the whole x-y plane
+    with h5py.File(args.ic_file, 'r') as ic_data:
+        index = read_cell_index(ic_data)
+        index_cdim = int(index['dimension'][0])
+        column = cell_ids(0, 0, np.arange(index_cdim), index_cdim)
+        coords = read_cells(ic_data['/PartType0/Coordinates'], cell_ranges(index, column))
+    print(f"{logger_info('ICs file')} Read {len(coords):d} particles of the top-level cells at x = y = 0")
+    num_2dlayers = len(np.unique(coords[:, 2]))
+    top_cell_counts = cell_counts(args.ic_file, cdim, chunk_rows=chunk_rows, workers=args.workers)
+
+else:
+    stats = validate_ic_file(args.ic_file, args.top_cells_per_tile, chunk_rows, args.workers)
+    checks = check_statistics(stats, args.nparticles)
+    for check, passed, details in checks:
+        print(f"{logger_info('Validation')} {check}: {'OK' if passed else 'FAILED'} ({details})")
+    num_2dlayers = stats['num_z_layers']
+    top_cell_counts = stats['cell_counts']
+
+# Number of stacked layers from the distinct z-coordinates
 print(f"{logger_info('Stacking')} Number of 2D layers stacked along z for one tile: {int(num_2dlayers / boxsize[0]):d}")
 print(f"{logger_info('Stacking')} Number of 2D layers stacked along z in total: {num_2dlayers:d}")
 
@@ -68,6 +76,13 @@ print(f"{logger_info('Domain decomposition')} Top-level-cells per tile: {args.to
 print(f"{logger_info('Domain decomposition')} Top-level-cells total: {args.top_cells_per_tile * int(boxsize[0])}^3")
 print(
     f"{logger_info('Domain decomposition')} Average particles per top-level-cell: {num_particles / (args.top_cells_per_tile * boxsize[0]) ** 3:.2f}")
+cell_load = imbalance_statistics(top_cell_counts)
+print((
+    f"{logger_info('Domain decomposition')} Particles per top-level-cell: "
+    f"{cell_load['min']:.0f} (min) {cell_load['max']:.0f} (max) {cell_load['std']:.2f} (std), "
+    f"{cell_load['empty']:d} empty, imbalance max/mean - 1 = {cell_load['imbalance']:.3f} "
+    f"(see predict_imbalance.py for the ranks)"
+))
 
 stride = 1
 if num_particles > 32 ** 3:
@@ -86,27 +101,14 @@ print(f"{logger_info('Plotting')} Generating dot-plot of particle positions... (
 # plt.savefig(os.path.join(args.outdir, 'coordinates.png'))
 # plt.close(fig)
 
+tiles_shape = tuple(int(i) for i in boxsize)
+tiles_colors = checkerboard_colors(tiles_shape, "crimson", "limegreen")
+
 fig = plt.figure(constrained_layout=True)
-ax = fig.gca(projection='3d')
+ax = fig.add_subplot(projection='3d')
 ax.set_aspect('equal')
 print(f"{logger_info('Plotting')} Generating tiling block-diagram...")
-positions = []
-sizes = []
-colors = []
-
-for i in range(int(boxsize[0])):
-    for j in range(int(boxsize[1])):
-        for k in range(int(boxsize[2])):
-            positions.append(tuple([i, j, k]))
-            sizes.append(tuple([1, 1, 1]))
-            if (i + j + k) % 2 == 0:
-                colors.append("crimson")
-            else:
-                colors.append("limegreen")
-
-for p, s, c in zip(positions, sizes, colors):
-    plotCubeAt(pos=p, size=s, ax=ax, color=c)
-
+draw_grid(ax, tiles_shape, tiles_colors)
 ax.set_xlabel('x')
 ax.set_ylabel('y')
 ax.set_zlabel('z')
@@ -115,32 +117,22 @@ plt.savefig(os.path.join(args.outdir, 'tiles.png'))
 plt.close(fig)
 
 fig = plt.figure()
-ax = fig.gca(projection='3d')
+ax = fig.add_subplot(projection='3d')
 ax.set_aspect('equal')
 print(f"{logger_info('Plotting')} Generating tiling top-level-cells diagram...")
+draw_grid(ax, tiles_shape, tiles_colors, alpha=0.3)
 
-for p, s, c in zip(positions, sizes, colors):
-    plotCubeAt(pos=p, size=s, ax=ax, color=c, alpha=0.3)
-
-top_cells_positions = []
-top_cells_sizes = []
-top_cells_colors = []
-
-for i in range(int(boxsize[0]) * args.top_cells_per_tile):
-    for j in range(int(boxsize[1]) * args.top_cells_per_tile):
-        for k in range(int(boxsize[2]) * args.top_cells_per_tile):
-            top_cells_positions.append(tuple([i / 3, j / 3, k / 3]))
-            top_cells_sizes.append(tuple([1 / 3, 1 / 3, 1 / 3]))
-            if (i + j + k) % 2 == 0:
-                top_cells_colors.append("grey")
-            else:
-                top_cells_colors.append("white")
-
-for p, s, c in zip(top_cells_positions, top_cells_sizes, top_cells_colors):
-    plotCubeAt(pos=p, size=s, ax=ax, color=c, alpha=0.3)
+top_cells_shape = tuple(n * args.top_cells_per_tile for n in tiles_shape)
+draw_grid(
+    ax, top_cells_shape, checkerboard_colors(top_cells_shape, "grey", "white"),
+    cell_size=1 / args.top_cells_per_tile, alpha=0.3
+)
 ax.set_xlabel('x')
 ax.set_ylabel('y')
 ax.set_zlabel('z')
 plt.tight_layout()
 plt.savefig(os.path.join(args.outdir, 'topcells.png'))
 plt.close(fig)
+
+if not all(passed for _, passed, _ in checks):
+    raise SystemExit(1)
@@ -1,8 +1,11 @@
+import h5py
 import swiftsimio as sw
 from swiftsimio.visualisation.projection import project_gas
 import argparse
+import numpy as np
 from matplotlib.pyplot import imsave
 from matplotlib.colors import LogNorm
+from ic_cells import read_cell_index, cells_in_region
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-i', '--ic-file', type=str, required=True)
@@ -19,6 +22,17 @@ load_region = [
     [0. * boxsize[2], 0.1 * boxsize[2]],
 ]
 
+# The mask reads the top-level cells overlapping the region from the
+# /Cells index, written by SWIFT and by make_ics_3d.py --sort-cells
+# (ICs without it can be sorted with reorder_ics.py)
+with h5py.File(args.ic_file, 'r') as ic_data:
+    index = read_cell_index(ic_data)
+cells = cells_in_region(index, [[float(lower), float(upper)] for lower, upper in load_region])
+print((
+    f"Reading {len(cells):d} of {len(index['counts']):d} top-level cells, "
+    f"{index['counts'][cells].sum():d} of {np.sum(index['counts']):d} particles"
+))
+
 mask.constrain_spatial(load_region)
 data = sw.load(args.ic_file, mask=mask)
 
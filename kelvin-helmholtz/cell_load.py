@@ -0,0 +1,167 @@
+"""
+Particles per top-level cell of IC and snapshot files, and the load of the
+MPI ranks under SWIFT's initial partitions of the cells.
+"""
+import h5py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Tuple, Optional
+from ic_cells import cell_grid_indices, cell_ids, read_cell_index
+from sfc import grid_order
+
+# grid: SWIFT's INITPART_GRID, a grid of ranks over the cells
+# vector: SWIFT's INITPART_VECTORIZE, each cell to the nearest of evenly
+#         spaced sample cells
+# sfc: cells cut into runs of equal particle counts along a Hilbert curve,
+#      an estimate of what a weighted partition (METIS) can reach
+partition_schemes = ['grid', 'vector', 'sfc']
+
+
+def bin_cells(coords: np.ndarray, box_size: np.ndarray, cdim: int) -> np.ndarray:
+    # Particles of each cell of a cdim^3 grid, by cell id
+    return np.bincount(cell_ids(*cell_grid_indices(coords, box_size, cdim), cdim), minlength=cdim ** 3)
+
+
+def chunk_cell_counts(path: str, part_type: str, start: int, end: int, box_size: np.ndarray, cdim: int) -> np.ndarray:
+    # Run in a worker process, which opens the file on its own
+    with h5py.File(path, 'r') as data:
+        return bin_cells(data[part_type]['Coordinates'][start:end], box_size, cdim)
+
+
+def cell_counts(
+        path: str,
+        cdim: int,
+        part_type: str = 'PartType0',
+        chunk_rows: int = 1 << 22,
+        workers: int = 4,
+        use_index: bool = True
+) -> np.ndarray:
+
+    # Particles per cell of a cdim^3 grid over the box, by cell id, from the
+    # coordinates read in chunks of chunk_rows rows in worker processes. A
+    # /Cells index with the same grid (SWIFT snapshots, sorted ICs) is used
+    # instead of the coordinates if use_index.
+    with h5py.File(path, 'r') as data:
+        box_size = np.broadcast_to(np.asarray(data['/Header'].attrs["BoxSize"], dtype=float), (3,))
+        if use_index and '/Cells' in data:
+            index = read_cell_index(data, part_type)
+            if np.all(index['dimension'] == cdim):
+                return index['counts']
+        num_rows = len(data[part_type]['Coordinates'])
+
+    # At most `workers` chunks in flight, added up as they complete
+    counts = np.zeros(cdim ** 3, dtype=np.int64)
+    chunk_rows = max(int(chunk_rows), 1)
+    workers = max(workers, 1)
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, num_rows, chunk_rows):
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    counts += future.result()
+            pending.add(executor.submit(
+                chunk_cell_counts, path, part_type, start, min(start + chunk_rows, num_rows), box_size, cdim
+            ))
+        for future in pending:
+            counts += future.result()
+    return counts
+
+
+def imbalance_statistics(counts: np.ndarray) -> Dict[str, float]:
+    # Spread of the loads (particles per cell or per rank). The imbalance
+    # is max / mean - 1: the fraction of the step the average unit waits
+    # for the most loaded one.
+    counts = np.asarray(counts, dtype=np.float64)
+    mean = counts.mean()
+    return {
+        'num': len(counts),
+        'total': counts.sum(),
+        'mean': mean,
+        'std': counts.std(),
+        'min': counts.min(),
+        'max': counts.max(),
+        'empty': int(np.count_nonzero(counts == 0)),
+        'cv': counts.std() / mean if mean > 0 else np.nan,
+        'imbalance': counts.max() / mean - 1 if mean > 0 else np.nan,
+    }
+
+
+def factor(value: int) -> Tuple[int, int]:
+    # SWIFT's factor(): the largest divisor up to sqrt(value), and its pair
+    for i in range(int(np.sqrt(value)), 0, -1):
+        if value % i == 0:
+            return i, value // i
+
+
+def grid_partition_shape(num_ranks: int) -> Tuple[int, int, int]:
+    # Grid of ranks of SWIFT's partition_init()
+    grid0, grid1 = factor(num_ranks)
+    grid0, grid2 = factor(num_ranks // grid1)
+    grid1, grid0 = factor(grid0 * grid1)
+    return grid0, grid1, grid2
+
+
+def grid_partition(cdim: int, num_ranks: int) -> np.ndarray:
+    # Rank of each cell, by cell id
+    grid = grid_partition_shape(num_ranks)
+    i, j, k = np.meshgrid(*(np.arange(cdim),) * 3, indexing='ij')
+    ind = [(index.ravel() * grid[axis]) // cdim for axis, index in enumerate((i, j, k))]
+    return ind[0] + grid[0] * (ind[1] + grid[1] * ind[2])
+
+
+def vector_partition(cdim: int, num_ranks: int, max_block_size: int = 1 << 22) -> np.ndarray:
+    # Rank of each cell, by cell id: SWIFT's pick_vector() takes every
+    # (cdim^3 // num_ranks)-th cell as a sample, split_vector() gives each
+    # cell the rank of the nearest sample in cell units, the first on ties.
+    # Distances are computed for blocks of max_block_size cell-sample pairs.
+    num_cells = cdim ** 3
+    if num_ranks > num_cells:
+        raise ValueError(f"Cannot split {num_cells} cells over {num_ranks} ranks")
+    samples = np.stack(np.unravel_index(np.arange(num_ranks) * (num_cells // num_ranks), (cdim,) * 3), axis=1)
+
+    ranks = np.empty(num_cells, dtype=np.int64)
+    cells_per_block = max(max_block_size // num_ranks, 1)
+    for start in range(0, num_cells, cells_per_block):
+        cells = np.stack(np.unravel_index(np.arange(start, min(start + cells_per_block, num_cells)), (cdim,) * 3), axis=1)
+        distances = ((cells[:, np.newaxis, :] - samples[np.newaxis, :, :]) ** 2).sum(axis=2)
+        ranks[start:start + len(cells)] = np.argmin(distances, axis=1)
+    return ranks
+
+
+def sfc_partition(counts: np.ndarray, cdim: int, num_ranks: int, curve: str = 'hilbert') -> np.ndarray:
+    # Rank of each cell, by cell id: the cells along the curve are cut where
+    # the cumulative count crosses multiples of total / num_ranks
+    position = grid_order(cdim, curve).ravel()
+    counts_along_curve = np.asarray(counts, dtype=np.float64)[np.argsort(position)]
+    middle = np.cumsum(counts_along_curve) - 0.5 * counts_along_curve
+    ranks_along_curve = np.minimum(
+        (middle * num_ranks // max(counts_along_curve.sum(), 1)).astype(np.int64), num_ranks - 1
+    )
+    return ranks_along_curve[position]
+
+
+def partition(counts: np.ndarray, cdim: int, num_ranks: int, scheme: str = 'grid') -> np.ndarray:
+    if scheme == 'grid':
+        return grid_partition(cdim, num_ranks)
+    if scheme == 'vector':
+        return vector_partition(cdim, num_ranks)
+    if scheme == 'sfc':
+        return sfc_partition(counts, cdim, num_ranks)
+    raise ValueError(f"Unknown partition scheme {scheme}, expected one of {partition_schemes}")
+
+
+def rank_loads(
+        counts: np.ndarray,
+        cdim: int,
+        num_ranks: int,
+        scheme: str = 'grid',
+        ranks: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    # Particles and cells of each rank
+    ranks = partition(counts, cdim, num_ranks, scheme) if ranks is None else ranks
+    return (
+        np.bincount(ranks, weights=counts, minlength=num_ranks).astype(np.int64),
+        np.bincount(ranks, minlength=num_ranks)
+    )
@@ -0,0 +1,234 @@
+"""
+Top-level cells of the IC files and their index, in the layout of the
+/Cells group of SWIFT snapshots.
+"""
+import os
+import h5py
+import numpy as np
+from tqdm import tqdm, trange
+from typing import Tuple, Optional, Dict, List
+from sfc import grid_order
+
+
+def cell_grid_indices(coords: np.ndarray, box_size: np.ndarray, cdim: int) -> Tuple[np.ndarray, ...]:
+    # Integer (i, j, k) of the top-level cell of each particle
+    box_size = np.broadcast_to(np.asarray(box_size, dtype=float), (3,))
+    return tuple(
+        np.clip(np.floor(coords[:, axis] / box_size[axis] * cdim).astype(np.int64), 0, cdim - 1)
+        for axis in range(3)
+    )
+
+
+def cell_ids(i: np.ndarray, j: np.ndarray, k: np.ndarray, cdim: int) -> np.ndarray:
+    # Cell index of SWIFT's cell_getid(): (i * cdim + j) * cdim + k
+    return (i * cdim + j) * cdim + k
+
+
+def cell_sfc_positions(coords: np.ndarray, box_size: np.ndarray, cdim: int, curve: str = 'hilbert') -> np.ndarray:
+    # Position along the curve of the top-level cell of each particle
+    return grid_order(cdim, curve)[cell_grid_indices(coords, box_size, cdim)]
+
+
+def cell_centres(cdim: int, box_size: np.ndarray) -> np.ndarray:
+    # (cdim^3, 3) centres, by cell id
+    cell_size = np.broadcast_to(np.asarray(box_size, dtype=float), (3,)) / cdim
+    i, j, k = np.meshgrid(*(np.arange(cdim),) * 3, indexing='ij')
+    return (np.stack([i.ravel(), j.ravel(), k.ravel()], axis=1) + 0.5) * cell_size
+
+
+def write_cell_index(
+        ic_file: h5py.File,
+        counts: np.ndarray,
+        offsets: np.ndarray,
+        cdim: int,
+        box_size: np.ndarray,
+        part_type: str = 'PartType0',
+        curve: Optional[str] = None,
+        min_positions: Optional[np.ndarray] = None,
+        max_positions: Optional[np.ndarray] = None
+) -> h5py.Group:
+
+    # /Cells group as in SWIFT snapshots: counts and offsets in the file of
+    # the particles of each top-level cell, and optionally their bounding
+    # boxes, indexed by cell id. The particles of a cell must be contiguous
+    # in the file.
+    box_size = np.broadcast_to(np.asarray(box_size, dtype=float), (3,))
+
+    grp = ic_file.require_group("/Cells")
+    meta_data = grp.require_group("Meta-data")
+    meta_data.attrs["dimension"] = np.array([cdim] * 3, dtype=np.int32)
+    meta_data.attrs["size"] = box_size / cdim
+    meta_data.attrs["nr_cells"] = cdim ** 3
+    if curve is not None:
+        meta_data.attrs["sfc_curve"] = curve
+
+    grp.create_dataset("Centres", data=cell_centres(cdim, box_size))
+    grp.require_group("Counts").create_dataset(part_type, data=np.asarray(counts, dtype=np.int64))
+    grp.require_group("OffsetsInFile").create_dataset(part_type, data=np.asarray(offsets, dtype=np.int64))
+    grp.require_group("Files").create_dataset(part_type, data=np.zeros(cdim ** 3, dtype=np.int32))
+    if min_positions is not None:
+        grp.require_group("MinPositions").create_dataset(part_type, data=min_positions)
+    if max_positions is not None:
+        grp.require_group("MaxPositions").create_dataset(part_type, data=max_positions)
+    return grp
+
+
+def read_cell_index(ic_file: h5py.File, part_type: str = 'PartType0') -> Dict[str, np.ndarray]:
+    # The /Cells group of an IC file or a SWIFT snapshot. Without bounding
+    # boxes, the cell bounds are used instead.
+    grp = ic_file['/Cells']
+    size = np.broadcast_to(grp['Meta-data'].attrs["size"], (3,))
+    index = {
+        'dimension': grp['Meta-data'].attrs["dimension"],
+        'size': size,
+        'centres': grp['Centres'][:],
+        'counts': grp['Counts'][part_type][:],
+        'offsets': grp['OffsetsInFile'][part_type][:],
+    }
+    has_bounds = 'MinPositions' in grp and part_type in grp['MinPositions']
+    index['min_positions'] = grp['MinPositions'][part_type][:] if has_bounds else index['centres'] - size / 2
+    index['max_positions'] = grp['MaxPositions'][part_type][:] if has_bounds else index['centres'] + size / 2
+    return index
+
+
+def cells_in_region(index: Dict[str, np.ndarray], region) -> np.ndarray:
+    # Ids of the non-empty cells whose bounding box overlaps the region
+    # [[x_min, x_max], [y_min, y_max], [z_min, z_max]] (not wrapped)
+    region = np.asarray(region, dtype=float)
+    overlap = np.all(
+        (index['min_positions'] <= region[:, 1]) & (index['max_positions'] >= region[:, 0]), axis=1
+    )
+    return np.flatnonzero(overlap & (index['counts'] > 0))
+
+
+def cell_ranges(index: Dict[str, np.ndarray], cells: np.ndarray) -> List[Tuple[int, int]]:
+    # Row ranges of the particles of the cells, adjacent ranges merged
+    cells = np.asarray(cells)
+    starts = index['offsets'][cells]
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], starts[order] + index['counts'][cells][order]
+
+    ranges = []
+    for start, end in zip(starts, ends):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], int(end)))
+        else:
+            ranges.append((int(start), int(end)))
+    return ranges
+
+
+def read_cells(dataset: h5py.Dataset, ranges: List[Tuple[int, int]]) -> np.ndarray:
+    # Rows of the dataset in the ranges, in file order
+    if len(ranges) == 0:
+        return np.empty((0,) + dataset.shape[1:], dtype=dataset.dtype)
+    return np.concatenate([dataset[start:end] for start, end in ranges])
+
+
+def sort_by_cell(
+        ic_data: h5py.File,
+        output: h5py.File,
+        cdim: int,
+        curve: str = 'hilbert',
+        memory_budget: int = 256 * 1024 ** 2,
+        runs_path: Optional[str] = None,
+        silent_progressbar: bool = False
+) -> h5py.Group:
+
+    # Copies the IC file to `output` with the particles sorted by the
+    # position of their top-level cell along the curve, and writes the
+    # /Cells index of the sorted file. Particles within a cell keep their
+    # order in the input.
+    #
+    # External merge sort on the cell keys: the input is split in runs that
+    # fit in the memory budget, each run is sorted in memory and written to
+    # a temporary file, then windows of consecutive keys are merged from the
+    # sorted runs. Since the keys are cell positions, the rows of each key
+    # in each run are known from the per-run key counts, so every window
+    # reads one contiguous segment per run and is written contiguously.
+    box_size = ic_data['/Header'].attrs["BoxSize"]
+    num_cells = cdim ** 3
+    particles = ic_data['/PartType0']
+    fields = list(particles)
+    num_gas_particles = len(particles['Coordinates'])
+    runs_path = f"{output.filename}.{os.getpid()}.runs.tmp" if runs_path is None else runs_path
+
+    # Rows per run and per merge window: a key, a permutation and the
+    # largest field, read and reordered
+    row_bytes = max(particles[name].dtype.itemsize * int(np.prod(particles[name].shape[1:])) for name in fields)
+    window = max(memory_budget // (2 * row_bytes + 16), 1)
+    run_starts = np.arange(0, num_gas_particles, window)
+    print(f"[Sort] {num_gas_particles:d} particles in {len(run_starts):d} runs of {window:d} rows into {cdim:d}^3 cells")
+
+    # Phase 1: sorted runs
+    run_counts = np.zeros((len(run_starts), num_cells), dtype=np.int64)
+    with h5py.File(runs_path, 'w') as runs:
+        for name in fields:
+            runs.create_dataset(name, shape=particles[name].shape, dtype=particles[name].dtype)
+
+        for r in trange(len(run_starts), desc="[Sort] runs", disable=silent_progressbar):
+            start, end = run_starts[r], min(run_starts[r] + window, num_gas_particles)
+            keys = cell_sfc_positions(particles['Coordinates'][start:end], box_size, cdim, curve)
+            order = np.argsort(keys, kind='stable')
+            run_counts[r] = np.bincount(keys, minlength=num_cells)
+            for name in fields:
+                runs[name][start:end] = particles[name][start:end][order]
+
+        # Phase 2: merge windows of consecutive keys
+        counts = run_counts.sum(axis=0)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        run_offsets = np.concatenate([np.zeros((len(run_starts), 1), dtype=np.int64), np.cumsum(run_counts, axis=1)], axis=1)
+        run_offsets += run_starts[:, np.newaxis]
+
+        # Cut the keys into windows of at most `window` rows (or one key)
+        window_edges = [0]
+        while window_edges[-1] < num_cells:
+            first = window_edges[-1]
+            last = np.searchsorted(offsets, offsets[first] + window, side='right') - 1
+            window_edges.append(min(max(last, first + 1), num_cells))
+
+        for group in ('Header', 'Units'):
+            if group in ic_data:
+                ic_data.copy(ic_data[group], output, name=group)
+        grp = output.create_group('PartType0')
+        for name in fields:
+            grp.create_dataset(name, shape=particles[name].shape, dtype=particles[name].dtype,
+                               chunks=particles[name].chunks, compression=particles[name].compression,
+                               compression_opts=particles[name].compression_opts, shuffle=particles[name].shuffle)
+
+        # Bounding boxes by key, empty cells collapse to their centre
+        min_positions = np.empty((num_cells, 3), dtype=particles['Coordinates'].dtype)
+        max_positions = np.empty((num_cells, 3), dtype=particles['Coordinates'].dtype)
+        for first, last in tqdm(list(zip(window_edges[:-1], window_edges[1:])), desc="[Sort] merge",
+                                disable=silent_progressbar):
+            if offsets[last] == offsets[first]:
+                continue
+
+            # Cell-major, run-minor order, i.e. stable in the input order
+            keys = np.concatenate([
+                np.repeat(np.arange(first, last), run_counts[r, first:last]) for r in range(len(run_starts))
+            ])
+            order = np.argsort(keys, kind='stable')
+            for name in fields:
+                values = np.concatenate([
+                    runs[name][run_offsets[r, first]:run_offsets[r, last]] for r in range(len(run_starts))
+                ])[order]
+                grp[name][offsets[first]:offsets[last]] = values
+
+                if name == 'Coordinates':
+                    filled = np.flatnonzero(counts[first:last] > 0)
+                    starts = (offsets[first:last] - offsets[first])[filled]
+                    min_positions[first + filled] = np.minimum.reduceat(values, starts, axis=0)
+                    max_positions[first + filled] = np.maximum.reduceat(values, starts, axis=0)
+
+    os.remove(runs_path)
+
+    # Index of the sorted file, by cell id
+    position = grid_order(cdim, curve).ravel()
+    empty = counts[position] == 0
+    centres = cell_centres(cdim, box_size)
+    min_positions, max_positions = min_positions[position], max_positions[position]
+    min_positions[empty] = max_positions[empty] = centres[empty]
+    return write_cell_index(
+        output, counts[position], offsets[:-1][position], cdim, box_size, curve=curve,
+        min_positions=min_positions, max_positions=max_positions
+    )
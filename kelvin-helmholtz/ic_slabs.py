@@ -0,0 +1,200 @@
+"""
+Slab-by-slab generation of the tiled IC fields in bounded memory.
+"""
+import queue
+import threading
+import numpy as np
+import psutil
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterator, Tuple, Dict, Callable
+from ic_writer import particle_fields
+
+
+def memory_budget_bytes(memory_budget_mb: Optional[float] = None, fraction: float = 0.25) -> int:
+    # Memory available to the slab buffers: the given budget, or a fraction
+    # of the memory currently available
+    if memory_budget_mb is not None:
+        return int(memory_budget_mb * 1024 ** 2)
+    return int(fraction * psutil.virtual_memory().available)
+
+
+def slabs_per_block(
+        name: str,
+        slab_size: int,
+        num_slabs: int,
+        memory_budget: int,
+        chunk_rows: Optional[int] = None
+) -> int:
+
+    # Number of z-slabs of field `name` that fit in the memory budget. If a
+    # chunk holds several slabs, blocks are a whole number of chunks, so
+    # that each chunk is written (and filtered) once.
+    columns, dtype, _ = particle_fields[name]
+    slab_bytes = slab_size * columns * np.dtype(dtype).itemsize
+    block = max(min(memory_budget // slab_bytes, num_slabs), 1)
+
+    if chunk_rows is not None and chunk_rows > slab_size:
+        chunk_slabs = chunk_rows // slab_size
+        if block >= chunk_slabs:
+            block -= block % chunk_slabs
+    return block
+
+
+class SlabField:
+    # Generates blocks of consecutive z-slabs of one field. `layer` is the
+    # field in one z-slab (for ParticleIDs, any array of the slab length).
+    # Buffers are initialised once with what all the slabs share and fill()
+    # only rewrites what differs: the z column of Coordinates and the IDs.
+    # IDs follow the particle order in the file, unless tile_order (the
+    # position of each [x, y, z] tile along a space-filling curve, see
+    # sfc.grid_order) is given: then the IDs of each tile are a contiguous
+    # range, and the ranges follow the curve.
+
+    def __init__(
+            self,
+            name: str,
+            layer: np.ndarray,
+            layers_per_tile: int,
+            first_id: int = 1,
+            tile_order: Optional[np.ndarray] = None
+    ):
+        self.name = name
+        self.columns, self.dtype, _ = particle_fields[name]
+        self.layer = layer
+        self.slab_size = len(layer)
+        self.layers_per_tile = layers_per_tile
+        self.first_id = first_id
+        self.tile_order = tile_order
+        self._ids: Optional[np.ndarray] = None
+
+    def new_buffer(self, block: int) -> np.ndarray:
+        buffer = np.empty((block, self.slab_size, self.columns), dtype=self.dtype)
+        if self.name == 'ParticleIDs':
+            if self._ids is None or len(self._ids) < buffer.size:
+                self._ids = np.arange(buffer.size, dtype=np.uint64)
+        else:
+            buffer[:] = np.asarray(self.layer).reshape((self.slab_size, self.columns))
+        return buffer
+
+    def fill(self, buffer: np.ndarray, start: int, num: int) -> np.ndarray:
+
+        # Slabs start ... start + num - 1, as a (num * slab_size, columns) view
+        if self.name == 'Coordinates':
+            buffer[:num, :, 2] = self.layer[:, 2] + (np.arange(start, start + num) / self.layers_per_tile)[:, np.newaxis]
+        elif self.name == 'ParticleIDs' and self.tile_order is None:
+            values = buffer[:num].reshape(-1)
+            np.add(self._ids[:len(values)], np.uint64(self.first_id + start * self.slab_size), out=values)
+        elif self.name == 'ParticleIDs':
+            # The slab holds one layer of each x-y tile, tile (i, j) in rows
+            # (i * tile + j) * num_part ... of the layer (see kh_lattice.tile_xy)
+            tile = self.tile_order.shape[0]
+            num_part = self.slab_size // tile ** 2
+            slabs = np.arange(start, start + num)
+            tile_z, layer = np.divmod(slabs, self.layers_per_tile)
+            offsets = (
+                    self.first_id +
+                    self.tile_order.reshape((tile ** 2, tile))[:, tile_z].T * num_part * self.layers_per_tile +
+                    layer[:, np.newaxis] * num_part
+            ).astype(np.uint64)
+            values = buffer[:num].reshape((num, tile ** 2, num_part))
+            np.add(self._ids[:num_part], offsets[:, :, np.newaxis], out=values)
+        return buffer[:num].reshape((-1, self.columns))
+
+
+def iter_slab_blocks(
+        name: str,
+        layer: np.ndarray,
+        slabs: range,
+        block: int,
+        layers_per_tile: int,
+        first_id: int = 1,
+        tile_order: Optional[np.ndarray] = None
+) -> Iterator[Tuple[int, np.ndarray]]:
+
+    # Yields (first slab, values) for consecutive blocks of up to `block`
+    # slabs of `slabs`, all views of one buffer allocated once
+    field = SlabField(name, layer, layers_per_tile, first_id, tile_order)
+    block = max(min(block, len(slabs)), 1)
+    buffer = field.new_buffer(block)
+    for start in range(slabs.start, slabs.stop, block):
+        yield start, field.fill(buffer, start, min(block, slabs.stop - start))
+
+
+def write_slab_fields(
+        fields: Dict[str, Tuple[SlabField, object, int]],
+        slabs: range,
+        first_slab: int = 0,
+        workers: int = 4,
+        buffers_per_field: int = 2,
+        on_write: Optional[Callable[[int], None]] = None
+) -> Dict[str, Dict[str, float]]:
+
+    # Producer/consumer writer. fields maps each name to (generator,
+    # dataset, slabs per block). Worker threads fill the blocks of all the
+    # fields concurrently, each field cycling through buffers_per_field
+    # buffers, while the calling thread writes the filled blocks in the
+    # order they come (HDF5 calls are serialised by h5py anyway). A buffer
+    # is only refilled once the writer has handed it back. on_write is
+    # called with the number of slabs of each block written.
+    # Returns the fill and write times of each field and its throughput in
+    # particles per second over the time spent on it.
+    filled = queue.Queue()
+    free = {name: queue.Queue() for name in fields}
+    stop = threading.Event()
+    stats = {name: {'particles': 0, 'fill_time': 0., 'write_time': 0.} for name in fields}
+
+    def produce(name: str) -> None:
+        field, _, block = fields[name]
+        block = max(min(block, len(slabs)), 1)
+        try:
+            for _ in range(buffers_per_field):
+                free[name].put(field.new_buffer(block))
+            for start in range(slabs.start, slabs.stop, block):
+                buffer = free[name].get()
+                if stop.is_set():
+                    return
+                tic = perf_counter()
+                values = field.fill(buffer, start, min(block, slabs.stop - start))
+                stats[name]['fill_time'] += perf_counter() - tic
+                filled.put((name, start, buffer, values))
+        except BaseException as error:
+            filled.put((name, None, None, error))
+            return
+        filled.put((name, None, None, None))
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for name in fields:
+            executor.submit(produce, name)
+
+        remaining = len(fields)
+        try:
+            while remaining > 0:
+                name, start, buffer, values = filled.get()
+                if start is None:
+                    remaining -= 1
+                    if values is not None:
+                        raise values
+                    continue
+
+                _, ds, _ = fields[name]
+                slab_size = fields[name][0].slab_size
+                offset = slab_size * (start - first_slab)
+                tic = perf_counter()
+                ds[offset:offset + len(values)] = values
+                stats[name]['write_time'] += perf_counter() - tic
+                stats[name]['particles'] += len(values)
+                free[name].put(buffer)
+                if on_write is not None:
+                    on_write(len(values) // slab_size)
+        finally:
+            # Unblock the producers waiting for a buffer if the writer failed
+            stop.set()
+            for name in fields:
+                for _ in range(buffers_per_field):
+                    free[name].put(None)
+
+    for name in stats:
+        busy_time = stats[name]['fill_time'] + stats[name]['write_time']
+        stats[name]['particles_per_second'] = stats[name]['particles'] / busy_time if busy_time > 0 else np.nan
+    return stats
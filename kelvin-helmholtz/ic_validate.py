@@ -0,0 +1,203 @@
+"""
+Streaming validation of IC files, chunk by chunk in bounded memory.
+"""
+import h5py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, List, Tuple
+from cell_load import bin_cells
+from ic_writer import particle_fields
+from kh_lattice import kh_lattice
+
+# Bytes per particle read by a chunk worker, with the temporaries
+chunk_row_bytes = 4 * sum(columns * np.dtype(dtype).itemsize for columns, dtype, _ in particle_fields.values())
+
+
+def chunk_ranges(num_rows: int, chunk_rows: int) -> List[Tuple[int, int]]:
+    chunk_rows = max(int(chunk_rows), 1)
+    return [(start, min(start + chunk_rows, num_rows)) for start in range(0, num_rows, chunk_rows)]
+
+
+def chunk_statistics(
+        path: str,
+        start: int,
+        end: int,
+        box_size: np.ndarray,
+        num_tiles: int,
+        cdim: int,
+        z_quantum: float
+) -> Dict[str, np.ndarray]:
+
+    # Statistics of rows start ... end - 1 of /PartType0. Run in a worker
+    # process, which opens the file on its own.
+    with h5py.File(path, 'r') as ic_data:
+        particles = ic_data['/PartType0']
+        coords = particles['Coordinates'][start:end]
+        vel = particles['Velocities'][start:end].astype(np.float64)
+        m = particles['Masses'][start:end].astype(np.float64).reshape(-1)
+        u = particles['InternalEnergy'][start:end].astype(np.float64).reshape(-1)
+
+    return {
+        'count': len(coords),
+        'min': coords.min(axis=0),
+        'max': coords.max(axis=0),
+        'z_layers': np.unique(np.rint(coords[:, 2] / z_quantum).astype(np.int64)),
+        'tile_counts': bin_cells(coords, box_size, num_tiles),
+        'cell_counts': bin_cells(coords, box_size, cdim),
+        'mass': m.sum(),
+        'thermal_energy': np.dot(m, u),
+        'kinetic_energy': 0.5 * np.dot(m, np.einsum('ij,ij->i', vel, vel)),
+    }
+
+
+class IDBitmap:
+    # One bit per expected ID, first_id ... first_id + num_ids - 1. IDs
+    # outside the range and IDs seen before are counted as they are added.
+
+    def __init__(self, first_id: int, num_ids: int):
+        self.first_id = first_id
+        self.num_ids = num_ids
+        self.bits = np.zeros((num_ids + 7) // 8, dtype=np.uint8)
+        self.out_of_range = 0
+        self.duplicates = 0
+
+    def add(self, ids: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.uint64).reshape(-1)
+        in_range = (ids >= np.uint64(self.first_id)) & (ids < np.uint64(self.first_id + self.num_ids))
+        self.out_of_range += int(np.count_nonzero(~in_range))
+
+        offsets = np.sort(ids[in_range] - np.uint64(self.first_id)).astype(np.int64)
+        repeated = np.zeros(len(offsets), dtype=bool)
+        repeated[1:] = offsets[1:] == offsets[:-1]
+        offsets = offsets[~repeated]
+        byte, bit = np.divmod(offsets, 8)
+        bit = np.left_shift(1, bit).astype(np.uint8)
+        self.duplicates += int(np.count_nonzero(repeated)) + int(np.count_nonzero(self.bits[byte] & bit))
+        np.bitwise_or.at(self.bits, byte, bit)
+
+    @property
+    def missing(self) -> int:
+        # Expected IDs never seen
+        return self.num_ids - int(np.unpackbits(self.bits, count=self.num_ids).sum())
+
+
+def validate_ic_file(
+        path: str,
+        top_cells_per_tile: int = 3,
+        chunk_rows: int = 1 << 20,
+        workers: int = 4,
+        z_quantum: float = 1e-9
+) -> Dict[str, object]:
+
+    # Streams the particles of the IC file in chunks of chunk_rows rows.
+    # Worker processes compute the statistics of at most `workers` chunks at
+    # a time, folded into the totals as they complete, while this process
+    # checks the IDs of each submitted chunk against a bitmap of the IDs in
+    # the header's range. z-coordinates are quantised to z_quantum (in box
+    # units) to count the distinct layers.
+    with h5py.File(path, 'r') as ic_data:
+        header = dict(ic_data['/Header'].attrs)
+        num_rows = len(ic_data['/PartType0/Coordinates'])
+    box_size = np.broadcast_to(np.asarray(header["BoxSize"], dtype=float), (3,))
+    num_tiles = int(round(box_size[0]))
+    cdim = num_tiles * top_cells_per_tile
+    workers = max(workers, 1)
+
+    stats = {
+        'header': header,
+        'count': 0,
+        'min': np.full(3, np.inf),
+        'max': np.full(3, -np.inf),
+        'tile_counts': np.zeros(num_tiles ** 3, dtype=np.int64),
+        'cell_counts': np.zeros(cdim ** 3, dtype=np.int64),
+        'mass': 0.,
+        'thermal_energy': 0.,
+        'kinetic_energy': 0.,
+    }
+    z_layers = set()
+    ids = IDBitmap(1, num_rows)
+
+    def fold(futures) -> None:
+        for future in futures:
+            chunk = future.result()
+            stats['count'] += chunk['count']
+            stats['min'] = np.minimum(stats['min'], chunk['min'])
+            stats['max'] = np.maximum(stats['max'], chunk['max'])
+            z_layers.update(chunk['z_layers'].tolist())
+            for key in ('tile_counts', 'cell_counts', 'mass', 'thermal_energy', 'kinetic_energy'):
+                stats[key] += chunk[key]
+
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor, h5py.File(path, 'r') as ic_data:
+        for start, end in chunk_ranges(num_rows, chunk_rows):
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                fold(done)
+            pending.add(executor.submit(
+                chunk_statistics, path, start, end, box_size, num_tiles, cdim, z_quantum * box_size[2]
+            ))
+            ids.add(ic_data['/PartType0/ParticleIDs'][start:end])
+        fold(pending)
+
+    stats['num_z_layers'] = len(z_layers)
+    stats['ids_out_of_range'] = ids.out_of_range
+    stats['ids_duplicated'] = ids.duplicates
+    stats['ids_missing'] = ids.missing
+    return stats
+
+
+def expected_statistics(nparticles: int, num_tiles: int) -> Dict[str, float]:
+    # What make_ics_3d.py -n nparticles -t num_tiles promises, from the
+    # lattice of one tile layer (fields cast to their dtype in the file)
+    _, vel, m, _, u = kh_lattice(nparticles)
+    vel = vel.astype(particle_fields['Velocities'][1]).astype(np.float64)
+    m = m.astype(particle_fields['Masses'][1]).astype(np.float64).reshape(-1)
+    u = u.astype(particle_fields['InternalEnergy'][1]).astype(np.float64).reshape(-1)
+    copies = num_tiles ** 3 * nparticles
+    return {
+        'count': len(m) * copies,
+        'particles_per_tile': len(m) * nparticles,
+        'num_z_layers': nparticles * num_tiles,
+        'mass': m.sum() * copies,
+        'thermal_energy': np.dot(m, u) * copies,
+        'kinetic_energy': 0.5 * np.dot(m, np.einsum('ij,ij->i', vel, vel)) * copies,
+    }
+
+
+def check_statistics(
+        stats: Dict[str, object],
+        nparticles: Optional[int] = None,
+        rtol: float = 1e-6
+) -> List[Tuple[str, bool, str]]:
+
+    # (check, passed, details) for the header against the particles, and
+    # with nparticles for both against the generator's promise
+    header = stats['header']
+    box_size = np.broadcast_to(np.asarray(header["BoxSize"], dtype=float), (3,))
+    num_tiles = int(round(box_size[0]))
+    count = stats['count']
+    checks = [
+        ("NumPart_Total", header["NumPart_Total"][0] == count, f"{header['NumPart_Total'][0]} in header, {count} read"),
+        ("NumPart_ThisFile", header["NumPart_ThisFile"][0] == count, f"{header['NumPart_ThisFile'][0]} in header"),
+        ("Bounds", bool(np.all(stats['min'] >= 0) & np.all(stats['max'] < box_size)),
+         f"{stats['min']} ... {stats['max']}, box {box_size}"),
+        ("Tiles", bool(np.all(stats['tile_counts'] == stats['tile_counts'][0])),
+         f"{stats['tile_counts'].min()} ... {stats['tile_counts'].max()} particles per tile"),
+        ("Layers", stats['num_z_layers'] % num_tiles == 0, f"{stats['num_z_layers']} z-layers over {num_tiles} tiles"),
+        ("ParticleIDs", stats['ids_out_of_range'] + stats['ids_duplicated'] + stats['ids_missing'] == 0, (
+            f"{stats['ids_out_of_range']} out of [1, {count}], {stats['ids_duplicated']} duplicated, "
+            f"{stats['ids_missing']} missing"
+        )),
+    ]
+
+    if nparticles is not None:
+        expected = expected_statistics(nparticles, num_tiles)
+        checks.append(("Particles", count == expected['count'], f"{count} read, {expected['count']} expected"))
+        checks.append(("Particles per tile", bool(np.all(stats['tile_counts'] == expected['particles_per_tile'])),
+                       f"{expected['particles_per_tile']} expected"))
+        checks.append(("Layers per tile", stats['num_z_layers'] == expected['num_z_layers'],
+                       f"{stats['num_z_layers']} read, {expected['num_z_layers']} expected"))
+        for key in ('mass', 'thermal_energy', 'kinetic_energy'):
+            checks.append((key.replace('_', ' ').capitalize(), bool(np.isclose(stats[key], expected[key], rtol=rtol)),
+                           f"{stats[key]:.9g} read, {expected[key]:.9g} expected"))
+    return checks
@@ -0,0 +1,208 @@
+"""
+HDF5 layout of the tiled Kelvin-Helmholtz ICs written by make_ics_3d.py.
+"""
+import os
+import h5py
+import numpy as np
+from typing import Optional, Tuple, Iterable, Dict, List
+
+# Datasets of /PartType0: (columns, dtype, compressible). Masses,
+# SmoothingLength and InternalEnergy take one value per density region.
+particle_fields = {
+    'Coordinates': (3, 'd', False),
+    'Velocities': (3, 'f', False),
+    'Masses': (1, 'f', True),
+    'SmoothingLength': (1, 'f', True),
+    'InternalEnergy': (1, 'f', True),
+    'ParticleIDs': (1, np.uint64, False),
+}
+
+# Fields that are the same in every z-slab, apart from Coordinates (z
+# offset) and ParticleIDs (slab offset)
+slab_invariant_fields = ('Velocities', 'Masses', 'SmoothingLength', 'InternalEnergy')
+
+compression_filters = [None, 'gzip', 'lzf']
+
+# lattice: IDs in file order
+# morton, hilbert: contiguous IDs per tile, tiles ordered along the curve
+id_orders = ['lattice', 'morton', 'hilbert']
+
+# full: all the fields are written for every slab
+# virtual: the slab-invariant fields are virtual datasets mapping every
+#          slab to the tile descriptor, readable through HDF5 as usual
+# descriptor: only the tile descriptor, see materialize_ics.py
+ic_layouts = ['full', 'virtual', 'descriptor']
+
+
+def open_ic_file(path: str, comm=None) -> h5py.File:
+    # With an MPI communicator the file is opened with the MPI-IO driver
+    # and all the ranks write to it (needs h5py built with parallel HDF5)
+    if comm is None:
+        return h5py.File(path, 'w')
+    return h5py.File(path, 'w', driver='mpio', comm=comm)
+
+
+def write_header(
+        ic_file: h5py.File,
+        num_gas_particles: int,
+        box_size: float,
+        num_files: int = 1,
+        num_part_this_file: Optional[int] = None
+) -> None:
+
+    num_part_this_file = num_gas_particles if num_part_this_file is None else num_part_this_file
+
+    # Header
+    grp = ic_file.create_group("/Header")
+    grp.attrs["BoxSize"] = [1. * box_size] * 3
+    grp.attrs["NumPart_Total"] = [num_gas_particles, 0, 0, 0, 0, 0]
+    grp.attrs["NumPart_Total_HighWord"] = [0, 0, 0, 0, 0, 0]
+    grp.attrs["NumPart_ThisFile"] = [num_part_this_file, 0, 0, 0, 0, 0]
+    grp.attrs["Time"] = 0.0
+    grp.attrs["NumFileOutputsPerSnapshot"] = num_files
+    grp.attrs["MassTable"] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    grp.attrs["Flag_Entropy_ICs"] = [0, 0, 0, 0, 0, 0]
+    grp.attrs["Dimension"] = 3
+
+    # Units
+    grp = ic_file.create_group("/Units")
+    grp.attrs["Unit length in cgs (U_L)"] = 1.
+    grp.attrs["Unit mass in cgs (U_M)"] = 1.
+    grp.attrs["Unit time in cgs (U_t)"] = 1.
+    grp.attrs["Unit current in cgs (U_I)"] = 1.
+    grp.attrs["Unit temperature in cgs (U_T)"] = 1.
+
+
+def slab_chunk_rows(slab_size: int, num_slabs: int, row_bytes: int, max_chunk_bytes: int) -> int:
+    # Rows per chunk such that chunk boundaries fall on z-slab boundaries:
+    # a whole number of slabs per chunk if one slab fits in max_chunk_bytes,
+    # otherwise the largest divisor of the slab size that fits
+    if slab_size * row_bytes <= max_chunk_bytes:
+        return slab_size * max(min(max_chunk_bytes // (slab_size * row_bytes), num_slabs), 1)
+
+    max_rows = max(max_chunk_bytes // row_bytes, 1)
+    divisors = set()
+    for i in range(1, int(np.sqrt(slab_size)) + 1):
+        if slab_size % i == 0:
+            divisors.update((i, slab_size // i))
+    return max(divisor for divisor in divisors if divisor <= max_rows)
+
+
+def create_particle_datasets(
+        ic_file: h5py.File,
+        num_gas_particles: int,
+        slab_size: int,
+        compression: Optional[str] = None,
+        compression_opts: Optional[int] = None,
+        shuffle: bool = False,
+        max_chunk_bytes: int = 64 * 1024 ** 2,
+        fields: Iterable[str] = tuple(particle_fields)
+) -> h5py.Group:
+
+    # Chunked /PartType0 datasets, with chunks aligned to the z-slabs of
+    # slab_size particles. The filters are applied to the compressible
+    # fields only.
+    grp = ic_file.require_group("/PartType0")
+    num_slabs = max(num_gas_particles // slab_size, 1)
+    for name in fields:
+        columns, dtype, compressible = particle_fields[name]
+        row_bytes = columns * np.dtype(dtype).itemsize
+        chunk_rows = min(slab_chunk_rows(slab_size, num_slabs, row_bytes, max_chunk_bytes), num_gas_particles)
+        filters = dict()
+        if compressible and compression is not None:
+            filters = dict(compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        grp.create_dataset(
+            name, (num_gas_particles, columns), dtype,
+            chunks=(max(chunk_rows, 1), columns), **filters
+        )
+    return grp
+
+
+def rank_slabs(num_slabs: int, comm=None) -> Iterable[int]:
+    # z-slabs written by this rank: all of them in serial mode, a contiguous
+    # block per rank with MPI, so each rank writes its own part of the file
+    if comm is None:
+        return range(num_slabs)
+    start, end = rank_slab_range(num_slabs, comm.Get_rank(), comm.Get_size())
+    return range(start, end)
+
+
+def rank_slab_range(num_slabs: int, rank: int, num_ranks: int) -> Tuple[int, int]:
+    return rank * num_slabs // num_ranks, (rank + 1) * num_slabs // num_ranks
+
+
+def write_tile_descriptor(
+        ic_file: h5py.File,
+        layer: Dict[str, np.ndarray],
+        num_slabs: int,
+        layers_per_tile: int,
+        first_id: int = 1,
+        id_order: str = 'lattice'
+) -> h5py.Group:
+
+    # One z-slab of every field except ParticleIDs, with the rules to
+    # generate the others: slab k has Coordinates[:, 2] + k / layers_per_tile
+    # and the ParticleIDs of ic_slabs.SlabField, given first_id and id_order
+    grp = ic_file.create_group("/TileDescriptor")
+    for name, values in layer.items():
+        columns, dtype, _ = particle_fields[name]
+        grp.create_dataset(name, data=np.asarray(values, dtype=dtype).reshape((-1, columns)))
+    grp.attrs["NumSlabs"] = num_slabs
+    grp.attrs["SlabSize"] = len(layer['Coordinates'])
+    grp.attrs["LayersPerTile"] = layers_per_tile
+    grp.attrs["FirstID"] = first_id
+    grp.attrs["IDOrder"] = id_order
+    return grp
+
+
+def create_virtual_datasets(
+        ic_file: h5py.File,
+        fields: Iterable[str] = slab_invariant_fields
+) -> h5py.Group:
+
+    # /PartType0 virtual datasets repeating the tile descriptor slab along z.
+    # The source file is '.', i.e. the IC file itself.
+    descriptor = ic_file['/TileDescriptor']
+    num_slabs = int(descriptor.attrs["NumSlabs"])
+    slab_size = int(descriptor.attrs["SlabSize"])
+
+    grp = ic_file.require_group("/PartType0")
+    for name in fields:
+        columns, dtype, _ = particle_fields[name]
+        layout = h5py.VirtualLayout(shape=(num_slabs * slab_size, columns), dtype=dtype)
+        source = h5py.VirtualSource('.', descriptor[name].name, shape=(slab_size, columns), dtype=dtype)
+        for k in range(num_slabs):
+            layout[slab_size * k:slab_size * (k + 1)] = source
+        grp.create_virtual_dataset(name, layout)
+    return grp
+
+
+def sub_file_name(file_name: str, index: int) -> str:
+    # kelvin_helmholtz_3d.hdf5 -> kelvin_helmholtz_3d.{index}.hdf5
+    base, extension = os.path.splitext(file_name)
+    return f"{base}.{index}{extension}"
+
+
+def create_multifile_virtual_datasets(
+        ic_file: h5py.File,
+        file_name: str,
+        num_part_per_file: List[int],
+        fields: Iterable[str] = tuple(particle_fields)
+) -> h5py.Group:
+
+    # /PartType0 virtual datasets concatenating the sub-files of file_name.
+    # The sub-file paths are relative, so they are found next to ic_file.
+    grp = ic_file.require_group("/PartType0")
+    num_gas_particles = sum(num_part_per_file)
+    for name in fields:
+        columns, dtype, _ = particle_fields[name]
+        layout = h5py.VirtualLayout(shape=(num_gas_particles, columns), dtype=dtype)
+        offset = 0
+        for i, num_part in enumerate(num_part_per_file):
+            source = h5py.VirtualSource(
+                sub_file_name(file_name, i), f"/PartType0/{name}", shape=(num_part, columns), dtype=dtype
+            )
+            layout[offset:offset + num_part] = source
+            offset += num_part
+        grp.create_virtual_dataset(name, layout)
+    return grp
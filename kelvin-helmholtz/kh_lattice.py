@@ -0,0 +1,86 @@
+"""
+Particle lattice of one Kelvin-Helmholtz tile, shared by the IC scripts.
+"""
+import numpy as np
+from typing import Tuple
+
+# Parameters
+gamma = 5. / 3.  # Gas adiabatic index
+P1 = 2.5  # Central region pressure
+P2 = 2.5  # Outskirts pressure
+v1 = 0.5  # Central region velocity
+v2 = -0.5  # Outskirts vlocity
+rho1 = 2  # Central density
+rho2 = 1  # Outskirts density
+omega0 = 0.1
+sigma = 0.05 / np.sqrt(2)
+
+
+def square_lattice(L: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Cell-centred x, y of an L x L grid, in the order of the nested loops
+    # `for i in range(L): for j in range(L)` (index = i * L + j)
+    edge = np.arange(L) / float(L) + 1. / (2. * L)
+    x, y = np.meshgrid(edge, edge, indexing='ij')
+    return x.ravel(), y.ravel()
+
+
+def kh_lattice(
+        nparticles: int,
+        dtype: np.dtype = np.float64
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Coordinates, velocities, masses, smoothing lengths and internal
+    # energies of one tile, with `nparticles` particles along one edge in the
+    # low-density region. Values are computed in double precision and cast
+    # to `dtype` at the end.
+
+    # Start by generating grids of particles at the two densities
+    L2 = nparticles
+    L1 = int(np.sqrt(L2 * L2 / rho2 * rho1))
+    x1, y1 = square_lattice(L1)
+    x2, y2 = square_lattice(L2)
+
+    # Central region from the dense grid, outskirts from the sparse one
+    where1 = np.abs(y1 - 0.5) < 0.25
+    where2 = np.abs(y2 - 0.5) > 0.25
+    num_part1 = np.count_nonzero(where1)
+    num_part = num_part1 + np.count_nonzero(where2)
+
+    coords = np.zeros((num_part, 3))
+    coords[:num_part1, 0] = x1[where1]
+    coords[:num_part1, 1] = y1[where1]
+    coords[num_part1:, 0] = x2[where2]
+    coords[num_part1:, 1] = y2[where2]
+
+    h = np.empty(num_part)
+    h[:num_part1] = 1.2348 / L1
+    h[num_part1:] = 1.2348 / L2
+    u = np.empty(num_part)
+    u[:num_part1] = P1 / (rho1 * (gamma - 1.))
+    u[num_part1:] = P2 / (rho2 * (gamma - 1.))
+    m = np.full(num_part, (0.5 * rho1 + 0.5 * rho2) / float(num_part))
+
+    # Velocity perturbation
+    vel = np.zeros((num_part, 3))
+    vel[:num_part1, 0] = v1
+    vel[num_part1:, 0] = v2
+    vel[:, 1] = omega0 * np.sin(4 * np.pi * coords[:, 0]) * (
+            np.exp(-(coords[:, 1] - 0.25) ** 2 / (2 * sigma ** 2)) +
+            np.exp(-(coords[:, 1] - 0.75) ** 2 / (2 * sigma ** 2)))
+
+    return (
+        coords.astype(dtype, copy=False),
+        vel.astype(dtype, copy=False),
+        m.astype(dtype, copy=False),
+        h.astype(dtype, copy=False),
+        u.astype(dtype, copy=False)
+    )
+
+
+def tile_xy(coords: np.ndarray, tile_h: int, tile_v: int) -> np.ndarray:
+    # Copies of the tile on a tile_h x tile_v grid, shifted by the tile
+    # index in x and y. Copy i * tile_v + j is shifted by (i, j).
+    num_part = len(coords)
+    tiled = np.tile(coords, (tile_h * tile_v, 1))
+    tiled[:, 0] += np.repeat(np.arange(tile_h, dtype=coords.dtype), tile_v * num_part)
+    tiled[:, 1] += np.tile(np.repeat(np.arange(tile_v, dtype=coords.dtype), num_part), tile_h)
+    return tiled
@@ -0,0 +1,53 @@
+"""
+Times the vectorized tile lattice of kh_lattice against the nested Python
+loops previously used by the IC scripts, for n = 128 ... 2048 particles
+along the edge of the low-density region.
+"""
+import argparse
+from time import perf_counter
+import numpy as np
+from kh_lattice import kh_lattice, rho1, rho2, P1, P2, gamma, v1, v2
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--nparticles', type=int, nargs='+', default=[128, 256, 512, 1024, 2048], required=False)
+parser.add_argument('-l', '--max-loops', type=int, default=1024, required=False,
+                    help="Largest n timed with the nested loops, which take minutes at n = 2048")
+parser.add_argument('-s', '--single-precision', action='store_true', default=False, required=False)
+args = parser.parse_args()
+
+
+def loop_lattice(nparticles: int):
+    # Grid construction of the previous implementation
+    L2 = nparticles
+    L1 = int(np.sqrt(L2 * L2 / rho2 * rho1))
+    grids = []
+    for L, P, rho, v in ((L1, P1, rho1, v1), (L2, P2, rho2, v2)):
+        coords = np.zeros((L * L, 3))
+        u = np.zeros(L * L)
+        vel = np.zeros((L * L, 3))
+        for i in range(L):
+            for j in range(L):
+                index = i * L + j
+                coords[index, 0] = i / float(L) + 1. / (2. * L)
+                coords[index, 1] = j / float(L) + 1. / (2. * L)
+                u[index] = P / (rho * (gamma - 1.))
+                vel[index, 0] = v
+        grids.append((coords, u, vel))
+    return grids
+
+
+dtype = np.float32 if args.single_precision else np.float64
+
+print(f"{'n':>6s} {'Particles':>12s} {'Vectorized [s]':>15s} {'Loops [s]':>10s} {'Speed-up':>9s}")
+for n in args.nparticles:
+    tic = perf_counter()
+    coords, _, _, _, _ = kh_lattice(n, dtype=dtype)
+    vectorized = perf_counter() - tic
+
+    if n <= args.max_loops:
+        tic = perf_counter()
+        loop_lattice(n)
+        loops = perf_counter() - tic
+        print(f"{n:6d} {len(coords):12d} {vectorized:15.3f} {loops:10.3f} {loops / vectorized:9.1f}")
+    else:
+        print(f"{n:6d} {len(coords):12d} {vectorized:15.3f} {'-':>10s} {'-':>9s}")
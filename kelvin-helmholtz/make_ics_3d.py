@@ -3,7 +3,16 @@ import numpy as np
 import os
 import psutil
 import argparse
-from tqdm import trange
+from tqdm import tqdm
+from kh_lattice import kh_lattice, tile_xy
+from ic_writer import (
+    open_ic_file, write_header, create_particle_datasets, rank_slabs, compression_filters,
+    ic_layouts, particle_fields, slab_invariant_fields, write_tile_descriptor, create_virtual_datasets,
+    rank_slab_range, sub_file_name, create_multifile_virtual_datasets, id_orders
+)
+from sfc import grid_order, sfc_curves
+from ic_cells import sort_by_cell
+from ic_slabs import memory_budget_bytes, slabs_per_block, SlabField, write_slab_fields
 
 total_memory = psutil.virtual_memory().total
 print(f"Total physical memory: {total_memory / 1024 / 1024 / 1024:.2f} GB")
@@ -24,77 +33,50 @@ parser.add_argument('-n', '--nparticles', type=int, default=128, required=False)
 parser.add_argument('-t', '--tile', type=int, default=2, required=False)
 parser.add_argument('-o', '--outdir', type=str, default='.', required=False)
 parser.add_argument('-s', '--silent-progressbar', action='store_true', default=False, required=False)
+parser.add_argument('-c', '--compression', type=str, choices=compression_filters[1:], default=None, required=False)
+parser.add_argument('--compression-level', type=int, default=None, required=False)
+parser.add_argument('--shuffle', action='store_true', default=False, required=False)
+parser.add_argument('--max-chunk-mb', type=float, default=64., required=False)
+parser.add_argument('-p', '--parallel', action='store_true', default=False, required=False,
+                    help="Write with MPI-IO, each rank writing its own z-slabs (run with mpirun)")
+parser.add_argument('-l', '--layout', type=str, choices=ic_layouts, default='full', required=False,
+                    help="'virtual' and 'descriptor' write the slab-invariant data once (see ic_writer.py)")
+parser.add_argument('-f', '--num-files', type=int, default=1, required=False,
+                    help="Split the particles along z over this many files, plus one virtual file joining them")
+parser.add_argument('-m', '--memory-budget-mb', type=float, default=None, required=False,
+                    help="Memory for the slab buffers, which sets the slabs per write (default: 1/4 of the available)")
+parser.add_argument('--id-order', type=str, choices=id_orders, default='lattice', required=False,
+                    help="'morton' and 'hilbert' give each tile a contiguous ID range, ordered along the curve")
+parser.add_argument('--sort-cells', type=str, choices=sfc_curves, default=None, required=False,
+                    help="Sort the particles by top-level cell along the curve and write the /Cells index")
+parser.add_argument('--top-cells-per-tile', type=int, default=3, required=False)
+parser.add_argument('-w', '--workers', type=int, default=4, required=False,
+                    help="Threads generating the slab buffers while the main thread writes them")
 args = parser.parse_args()
 
-# Parameters
-L2 = args.nparticles  # Particles along one edge in the low-density region
-gamma = 5. / 3.  # Gas adiabatic index
-P1 = 2.5  # Central region pressure
-P2 = 2.5  # Outskirts pressure
-v1 = 0.5  # Central region velocity
-v2 = -0.5  # Outskirts vlocity
-rho1 = 2  # Central density
-rho2 = 1  # Outskirts density
-omega0 = 0.1
-sigma = 0.05 / np.sqrt(2)
+# HDF5 filters need collective writes in parallel mode, while each rank
+# writes its own slabs independently
+if args.parallel and args.compression is not None:
+    parser.error("--compression is not supported with --parallel")
+if args.parallel and args.layout != 'full':
+    parser.error("--layout must be 'full' with --parallel")
+if args.num_files > 1 and args.layout != 'full':
+    parser.error("--layout must be 'full' with --num-files")
+if args.sort_cells is not None and (args.parallel or args.layout != 'full' or args.num_files > 1):
+    parser.error("--sort-cells needs a single file with --layout 'full', without --parallel")
+
+comm = None
+if args.parallel:
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+
 fileOutputName = "kelvin_helmholtz_3d.hdf5"
 # ---------------------------------------------------
 
-# Start by generating grids of particles at the two densities
-numPart2 = L2 * L2
-L1 = int(np.sqrt(numPart2 / rho2 * rho1))
-numPart1 = L1 * L1
-coords1 = np.zeros((numPart1, 3))
-coords2 = np.zeros((numPart2, 3))
-h1 = np.ones(numPart1) * 1.2348 / L1
-h2 = np.ones(numPart2) * 1.2348 / L2
-m1 = np.zeros(numPart1)
-m2 = np.zeros(numPart2)
-u1 = np.zeros(numPart1)
-u2 = np.zeros(numPart2)
-vel1 = np.zeros((numPart1, 3))
-vel2 = np.zeros((numPart2, 3))
-
-# Particles in the central region
-for i in range(L1):
-    for j in range(L1):
-        index = i * L1 + j
-        x = i / float(L1) + 1. / (2. * L1)
-        y = j / float(L1) + 1. / (2. * L1)
-        coords1[index, 0] = x
-        coords1[index, 1] = y
-        u1[index] = P1 / (rho1 * (gamma - 1.))
-        vel1[index, 0] = v1
-
-# Particles in the outskirts
-for i in range(L2):
-    for j in range(L2):
-        index = i * L2 + j
-        x = i / float(L2) + 1. / (2. * L2)
-        y = j / float(L2) + 1. / (2. * L2)
-        coords2[index, 0] = x
-        coords2[index, 1] = y
-        u2[index] = P2 / (rho2 * (gamma - 1.))
-        vel2[index, 0] = v2
-
-# Now concatenate arrays
-where1 = np.abs(coords1[:, 1] - 0.5) < 0.25
-where2 = np.abs(coords2[:, 1] - 0.5) > 0.25
-
-coords = np.append(coords1[where1, :], coords2[where2, :], axis=0)
-vel = np.append(vel1[where1, :], vel2[where2, :], axis=0)
-h = np.append(h1[where1], h2[where2], axis=0)
-m = np.append(m1[where1], m2[where2], axis=0)
-u = np.append(u1[where1], u2[where2], axis=0)
+# Particles of one tile: the central region and the outskirts
+coords, vel, m, h, u = kh_lattice(args.nparticles)
 numPart = np.size(h)
-m[:] = (0.5 * rho1 + 0.5 * rho2) / float(numPart)
-
-# Velocity perturbation
-vel[:, 1] = omega0 * np.sin(4 * np.pi * coords[:, 0]) * (
-        np.exp(-(coords[:, 1] - 0.25) ** 2 / (2 * sigma ** 2)) + np.exp(-(coords[:, 1] - 0.75) ** 2 / (2 * sigma ** 2)))
 
-# File
-fileOutput = h5py.File(os.path.join(args.outdir, fileOutputName), 'w')
 num_gas_particles = numPart * args.tile ** 3 * args.nparticles
 print((
     f"Total number of gas particles (3D): {num_gas_particles:d} "
@@ -102,87 +84,135 @@ print((
     f"(approx. 2^{np.log2(num_gas_particles):.0f})"
 ))
 
-# Header
-grp = fileOutput.create_group("/Header")
-grp.attrs["BoxSize"] = [1. * args.tile] * 3
-grp.attrs["NumPart_Total"] = [num_gas_particles, 0, 0, 0, 0, 0]
-grp.attrs["NumPart_Total_HighWord"] = [0, 0, 0, 0, 0, 0]
-grp.attrs["NumPart_ThisFile"] = [num_gas_particles, 0, 0, 0, 0, 0]
-grp.attrs["Time"] = 0.0
-grp.attrs["NumFileOutputsPerSnapshot"] = 1
-grp.attrs["MassTable"] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-grp.attrs["Flag_Entropy_ICs"] = [0, 0, 0, 0, 0, 0]
-grp.attrs["Dimension"] = 3
-
-# Units
-grp = fileOutput.create_group("/Units")
-grp.attrs["Unit length in cgs (U_L)"] = 1.
-grp.attrs["Unit mass in cgs (U_M)"] = 1.
-grp.attrs["Unit time in cgs (U_t)"] = 1.
-grp.attrs["Unit current in cgs (U_I)"] = 1.
-grp.attrs["Unit temperature in cgs (U_T)"] = 1.
-
-# Particle group
-grp = fileOutput.create_group("/PartType0")
-dump_memory_usage()
-ds = grp.create_dataset('Coordinates', (num_gas_particles, 3), 'd')
-coords = np.tile(coords, (args.tile ** 2, 1))
-for i in trange(args.tile, desc=f"[x-stack]{ds.name.replace('/', ' ')}", disable=args.silent_progressbar):
-    coords[numPart * args.tile * i:numPart * (i + 1) * args.tile, 0] += i
-    for j in trange(args.tile, desc=f"[y-stack]{ds.name.replace('/', ' ')}", leave=None,
-                    disable=args.silent_progressbar):
-        coords[numPart * (i * args.tile + j):numPart * (i * args.tile + j + 1), 1] += j
-
-# Stack layers
-dump_memory_usage()
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    buffer = coords.copy()
-    buffer[:, 2] += k / args.nparticles
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = buffer
-del coords
-
-dump_memory_usage()
-ds = grp.create_dataset('Velocities', (num_gas_particles, 3), 'f')
+# One 2D layer of all the x-y tiles makes a z-slab
+slab_size = numPart * args.tile ** 2
+num_slabs = args.nparticles * args.tile
+coords = tile_xy(coords, args.tile, args.tile)
 vel = np.tile(vel, (args.tile ** 2, 1)).reshape((-1, 3))
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = vel
-del vel
-
-dump_memory_usage()
-ds = grp.create_dataset('Masses', (num_gas_particles, 1), 'f')
 m = np.tile(m, (args.tile ** 2, 1)).reshape((-1, 1))
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = m
-del m
-
-dump_memory_usage()
-ds = grp.create_dataset('SmoothingLength', (num_gas_particles, 1), 'f')
 h = np.tile(h, (args.tile ** 2, 1)).reshape((-1, 1))
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = h
-del h
-
-dump_memory_usage()
-ds = grp.create_dataset('InternalEnergy', (num_gas_particles, 1), 'f')
 u = np.tile(u, (args.tile ** 2, 1)).reshape((-1, 1))
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = u
-buffer_len = u.shape[0]
-del u
-
-dump_memory_usage()
-ds = grp.create_dataset('ParticleIDs', (num_gas_particles, 1), dtype=np.uint64)
-ids = np.linspace(1, buffer_len, buffer_len, dtype=np.uint64).reshape((-1, 1))
-for k in trange(args.nparticles * args.tile, desc=f"[z-stack]{ds.name.replace('/', ' ')}",
-                disable=args.silent_progressbar):
-    buffer = ids.copy()
-    buffer[:] += k * buffer_len
-    ds[numPart * args.tile ** 2 * k:numPart * args.tile ** 2 * (k + 1)] = buffer.reshape((-1, 1))
-del ids
-
+silent_progressbar = args.silent_progressbar or (comm is not None and comm.Get_rank() > 0)
+memory_budget = memory_budget_bytes(args.memory_budget_mb)
+buffers_per_field = 2
+tile_order = None if args.id_order == 'lattice' else grid_order(args.tile, args.id_order)
+print(f"[Resources] Memory budget for the slab buffers: {memory_budget / 1024 / 1024:.2f} MB")
+
+
+def write_particles(grp, slabs: range, first_slab: int = 0, write_invariant: bool = True) -> None:
+    # Writes the z-slabs `slabs` of all the fields, slab k at row
+    # (k - first_slab) * slab_size of the datasets in `grp`. The blocks of
+    # slabs of all the fields are generated concurrently by --workers
+    # threads and written by this one, within the memory budget.
+    layers = {
+        'Coordinates': coords,
+        'Velocities': vel,
+        'Masses': m,
+        'SmoothingLength': h,
+        'InternalEnergy': u,
+        'ParticleIDs': coords,
+    }
+
+    # Virtual datasets read the slab-invariant fields from the tile descriptor
+    names = [name for name in layers if write_invariant or name not in slab_invariant_fields]
+    field_budget = memory_budget // (len(names) * buffers_per_field)
+    fields = {
+        name: (
+            SlabField(name, layers[name], args.nparticles, tile_order=tile_order),
+            grp[name],
+            slabs_per_block(name, slab_size, len(slabs), field_budget, grp[name].chunks[0])
+        ) for name in names
+    }
+
+    dump_memory_usage()
+    progress = tqdm(total=len(names) * len(slabs), desc=f"[z-stack] {grp.name.strip('/')}", disable=silent_progressbar)
+    stats = write_slab_fields(
+        fields, slabs, first_slab,
+        workers=args.workers,
+        buffers_per_field=buffers_per_field,
+        on_write=progress.update
+    )
+    progress.close()
+    dump_memory_usage()
+
+    if not silent_progressbar:
+        for name, field_stats in stats.items():
+            print((
+                f"[Throughput] {name:>16s}: {field_stats['particles_per_second']:.3e} particles/s "
+                f"(fill {field_stats['fill_time']:.2f} s, write {field_stats['write_time']:.2f} s)"
+            ))
+
+
+dataset_options = dict(
+    compression=args.compression,
+    compression_opts=args.compression_level,
+    shuffle=args.shuffle,
+    max_chunk_bytes=int(args.max_chunk_mb * 1024 ** 2)
+)
+
+if args.num_files > 1:
+
+    # Sub-files of contiguous z-slabs. With --parallel, each rank writes
+    # its own files with the serial driver.
+    file_indices = range(args.num_files)
+    if comm is not None:
+        file_indices = range(comm.Get_rank(), args.num_files, comm.Get_size())
+
+    for i in file_indices:
+        first_slab, end_slab = rank_slab_range(num_slabs, i, args.num_files)
+        num_part_this_file = (end_slab - first_slab) * slab_size
+        with open_ic_file(os.path.join(args.outdir, sub_file_name(fileOutputName, i))) as fileOutput:
+            write_header(fileOutput, num_gas_particles, args.tile, args.num_files, num_part_this_file)
+            grp = create_particle_datasets(fileOutput, num_part_this_file, slab_size, **dataset_options)
+            write_particles(grp, range(first_slab, end_slab), first_slab)
+
+    # Single-file view of the sub-files, for readers of one IC file
+    if comm is None or comm.Get_rank() == 0:
+        with open_ic_file(os.path.join(args.outdir, fileOutputName)) as fileOutput:
+            write_header(fileOutput, num_gas_particles, args.tile)
+            create_multifile_virtual_datasets(fileOutput, fileOutputName, [
+                (end_slab - first_slab) * slab_size
+                for first_slab, end_slab in (rank_slab_range(num_slabs, i, args.num_files)
+                                             for i in range(args.num_files))
+            ])
+    raise SystemExit
+
+# File. With --sort-cells, the slabs are written to a temporary file first.
+unsortedOutputName = f"{fileOutputName}.{os.getpid()}.unsorted.tmp"
+fileOutput = open_ic_file(os.path.join(
+    args.outdir, fileOutputName if args.sort_cells is None else unsortedOutputName
+), comm)
+write_header(fileOutput, num_gas_particles, args.tile)
+
+if args.layout != 'full':
+    write_tile_descriptor(
+        fileOutput,
+        {'Coordinates': coords, 'Velocities': vel, 'Masses': m, 'SmoothingLength': h, 'InternalEnergy': u},
+        num_slabs=num_slabs,
+        layers_per_tile=args.nparticles,
+        id_order=args.id_order
+    )
+if args.layout == 'descriptor':
+    fileOutput.close()
+    raise SystemExit
+
+# Particle group, chunked by z-slabs
+written_fields = particle_fields if args.layout == 'full' else [
+    name for name in particle_fields if name not in slab_invariant_fields
+]
+grp = create_particle_datasets(fileOutput, num_gas_particles, slab_size, fields=written_fields, **dataset_options)
+if args.layout == 'virtual':
+    create_virtual_datasets(fileOutput)
+
+write_particles(grp, rank_slabs(num_slabs, comm), write_invariant=args.layout == 'full')
 fileOutput.close()
+
+if args.sort_cells is not None:
+    with h5py.File(os.path.join(args.outdir, unsortedOutputName), 'r') as ic_data, \
+            h5py.File(os.path.join(args.outdir, fileOutputName), 'w') as fileOutput:
+        sort_by_cell(
+            ic_data, fileOutput, args.tile * args.top_cells_per_tile, args.sort_cells,
+            memory_budget=memory_budget,
+            silent_progressbar=silent_progressbar
+        )
+    os.remove(os.path.join(args.outdir, unsortedOutputName))
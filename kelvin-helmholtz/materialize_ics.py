@@ -0,0 +1,60 @@
+import h5py
+import os
+import argparse
+from tqdm import tqdm
+from ic_writer import open_ic_file, write_header, create_particle_datasets, compression_filters, particle_fields
+from ic_slabs import memory_budget_bytes, slabs_per_block, iter_slab_blocks
+from sfc import grid_order
+
+# Writes the full IC file described by the /TileDescriptor group of an IC
+# file made with make_ics_3d.py --layout virtual or --layout descriptor
+parser = argparse.ArgumentParser()
+parser.add_argument('-i', '--ic-file', type=str, required=True)
+parser.add_argument('-o', '--output', type=str, required=True)
+parser.add_argument('-s', '--silent-progressbar', action='store_true', default=False, required=False)
+parser.add_argument('-c', '--compression', type=str, choices=compression_filters[1:], default=None, required=False)
+parser.add_argument('--compression-level', type=int, default=None, required=False)
+parser.add_argument('--shuffle', action='store_true', default=False, required=False)
+parser.add_argument('--max-chunk-mb', type=float, default=64., required=False)
+parser.add_argument('-m', '--memory-budget-mb', type=float, default=None, required=False)
+args = parser.parse_args()
+
+if os.path.abspath(args.ic_file) == os.path.abspath(args.output):
+    parser.error("the output must be a different file")
+
+with h5py.File(args.ic_file, 'r') as ic_data:
+    descriptor = ic_data['/TileDescriptor']
+    num_slabs = int(descriptor.attrs["NumSlabs"])
+    slab_size = int(descriptor.attrs["SlabSize"])
+    num_gas_particles = num_slabs * slab_size
+    box_size = ic_data['/Header'].attrs["BoxSize"][0]
+    print(f"Total number of gas particles (3D): {num_gas_particles:d}")
+
+    fileOutput = open_ic_file(args.output)
+    write_header(fileOutput, num_gas_particles, box_size)
+    grp = create_particle_datasets(
+        fileOutput, num_gas_particles, slab_size,
+        compression=args.compression,
+        compression_opts=args.compression_level,
+        shuffle=args.shuffle,
+        max_chunk_bytes=int(args.max_chunk_mb * 1024 ** 2)
+    )
+
+    memory_budget = memory_budget_bytes(args.memory_budget_mb)
+    first_id = int(descriptor.attrs["FirstID"])
+    layers_per_tile = int(descriptor.attrs["LayersPerTile"])
+    id_order = descriptor.attrs.get("IDOrder", 'lattice')
+    tile_order = None if id_order == 'lattice' else grid_order(num_slabs // layers_per_tile, id_order)
+    for name in particle_fields:
+        ds = grp[name]
+        layer = descriptor['Coordinates' if name == 'ParticleIDs' else name][()]
+        block = slabs_per_block(name, slab_size, num_slabs, memory_budget, ds.chunks[0])
+        progress = tqdm(total=num_slabs, desc=f"[z-stack]{ds.name.replace('/', ' ')}", disable=args.silent_progressbar)
+        for start, values in iter_slab_blocks(
+                name, layer, range(num_slabs), block, layers_per_tile, first_id, tile_order
+        ):
+            ds[slab_size * start:slab_size * start + len(values)] = values
+            progress.update(len(values) // slab_size)
+        progress.close()
+
+    fileOutput.close()
@@ -0,0 +1,49 @@
+import argparse
+import h5py
+import numpy as np
+from cell_load import cell_counts, imbalance_statistics, rank_loads, partition_schemes
+from ic_slabs import memory_budget_bytes
+
+# Predicts the particle load of the MPI ranks of a SWIFT run from its IC
+# file (or a snapshot), for the initial partitions of the top-level cells
+# over the given numbers of ranks
+parser = argparse.ArgumentParser()
+parser.add_argument('-i', '--ic-file', type=str, required=True)
+parser.add_argument('-t', '--top-cells-per-tile', type=int, default=3, required=False,
+                    help="Top-level cells along each tile, i.e. per unit box length")
+parser.add_argument('-r', '--ranks', type=int, nargs='+', default=[2, 4, 8, 16, 32, 64], required=False)
+parser.add_argument('--schemes', type=str, nargs='+', choices=partition_schemes, default=partition_schemes,
+                    required=False)
+parser.add_argument('--part-type', type=str, default='PartType0', required=False)
+parser.add_argument('-w', '--workers', type=int, default=4, required=False)
+parser.add_argument('-m', '--memory-budget-mb', type=float, default=None, required=False)
+args = parser.parse_args()
+
+with h5py.File(args.ic_file, 'r') as data:
+    box_size = data['/Header'].attrs["BoxSize"]
+cdim = int(round(np.atleast_1d(box_size)[0])) * args.top_cells_per_tile
+
+# Chunks of coordinates (and their cell indices), one per worker at a time
+chunk_rows = memory_budget_bytes(args.memory_budget_mb) // ((args.workers + 1) * 64)
+counts = cell_counts(args.ic_file, cdim, args.part_type, chunk_rows, args.workers)
+
+cells = imbalance_statistics(counts)
+print(f"Top-level cells: {cdim:d}^3, {cells['total']:.0f} particles")
+print((
+    f"Particles per cell: mean {cells['mean']:.2f}, std {cells['std']:.2f}, min {cells['min']:.0f}, "
+    f"max {cells['max']:.0f}, {cells['empty']:d} empty, imbalance {cells['imbalance']:.3f}"
+))
+
+print(f"{'Scheme':>8s} {'Ranks':>6s} {'Particles min':>14s} {'mean':>12s} {'max':>12s} {'Cells max':>10s} "
+      f"{'Idle ranks':>10s} {'Imbalance':>10s}")
+for scheme in args.schemes:
+    for num_ranks in args.ranks:
+        if num_ranks > cdim ** 3:
+            print(f"{scheme:>8s} {num_ranks:6d} more ranks than top-level cells")
+            continue
+        particles, rank_cells = rank_loads(counts, cdim, num_ranks, scheme)
+        ranks = imbalance_statistics(particles)
+        print((
+            f"{scheme:>8s} {num_ranks:6d} {ranks['min']:14.0f} {ranks['mean']:12.1f} {ranks['max']:12.0f} "
+            f"{rank_cells.max():10d} {ranks['empty']:10d} {ranks['imbalance']:10.3f}"
+        ))
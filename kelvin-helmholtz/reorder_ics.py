@@ -0,0 +1,29 @@
+import h5py
+import os
+import argparse
+from ic_cells import sort_by_cell
+from ic_slabs import memory_budget_bytes
+from sfc import sfc_curves
+
+# Sorts the particles of an IC file by the position of their top-level cell
+# along a space-filling curve, out of core, and writes the /Cells index of
+# the sorted file (see ic_cells.sort_by_cell)
+parser = argparse.ArgumentParser()
+parser.add_argument('-i', '--ic-file', type=str, required=True)
+parser.add_argument('-o', '--output', type=str, required=True)
+parser.add_argument('-t', '--top-cells-per-tile', type=int, default=3, required=False)
+parser.add_argument('-c', '--curve', type=str, choices=sfc_curves, default='hilbert', required=False)
+parser.add_argument('-m', '--memory-budget-mb', type=float, default=None, required=False)
+parser.add_argument('-s', '--silent-progressbar', action='store_true', default=False, required=False)
+args = parser.parse_args()
+
+if os.path.abspath(args.ic_file) == os.path.abspath(args.output):
+    parser.error("the output must be a different file")
+
+with h5py.File(args.ic_file, 'r') as ic_data, h5py.File(args.output, 'w') as fileOutput:
+    cdim = int(round(ic_data['/Header'].attrs["BoxSize"][0])) * args.top_cells_per_tile
+    sort_by_cell(
+        ic_data, fileOutput, cdim, args.curve,
+        memory_budget=memory_budget_bytes(args.memory_budget_mb),
+        silent_progressbar=args.silent_progressbar
+    )
@@ -0,0 +1,85 @@
+"""
+Morton and Peano-Hilbert keys of integer 3D grid coordinates.
+"""
+import numpy as np
+
+sfc_curves = ['morton', 'hilbert']
+
+# Up to 21 bits per dimension fit in a 64-bit key
+max_bits = 21
+
+
+def spread_bits(values: np.ndarray) -> np.ndarray:
+    # Insert two zero bits between the (up to 21) low bits of each value
+    x = np.asarray(values, dtype=np.uint64) & np.uint64(0x1fffff)
+    x = (x | (x << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return x
+
+
+def morton_key(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    # Interleaved bits, x most significant in each triplet
+    return (spread_bits(x) << np.uint64(2)) | (spread_bits(y) << np.uint64(1)) | spread_bits(z)
+
+
+def hilbert_key(x: np.ndarray, y: np.ndarray, z: np.ndarray, bits: int) -> np.ndarray:
+    # Skilling's algorithm (AIP Conf. Proc. 707, 381, 2004), vectorised:
+    # the axes are transformed in place into the transpose of the Hilbert
+    # index, whose bits are then interleaved like a Morton key
+    axes = [np.array(a, dtype=np.uint64, copy=True) for a in (x, y, z)]
+
+    q = 1 << (bits - 1)
+    while q > 1:
+        p = np.uint64(q - 1)
+        for i in range(3):
+            mask = (axes[i] & np.uint64(q)) != 0
+            axes[0] = np.where(mask, axes[0] ^ p, axes[0])
+            t = np.where(mask, np.uint64(0), (axes[0] ^ axes[i]) & p)
+            axes[0] ^= t
+            axes[i] ^= t
+        q >>= 1
+
+    # Gray encode
+    axes[1] ^= axes[0]
+    axes[2] ^= axes[1]
+    t = np.zeros_like(axes[0])
+    q = 1 << (bits - 1)
+    while q > 1:
+        t = np.where((axes[2] & np.uint64(q)) != 0, t ^ np.uint64(q - 1), t)
+        q >>= 1
+    for i in range(3):
+        axes[i] ^= t
+
+    return morton_key(*axes)
+
+
+def sfc_key(x: np.ndarray, y: np.ndarray, z: np.ndarray, bits: int, curve: str = 'morton') -> np.ndarray:
+    # Key of the grid cells (x, y, z), each coordinate in [0, 2**bits)
+    if bits > max_bits:
+        raise ValueError(f"At most {max_bits} bits per dimension fit in a 64-bit key, got {bits}")
+    if curve == 'morton':
+        return morton_key(x, y, z)
+    if curve == 'hilbert':
+        return hilbert_key(x, y, z, max(bits, 1))
+    raise ValueError(f"Unknown space-filling curve {curve}, expected one of {sfc_curves}")
+
+
+def grid_bits(num_cells: int) -> int:
+    # Bits per dimension of a grid with num_cells cells along each side
+    return max(int(np.ceil(np.log2(max(num_cells, 1)))), 1)
+
+
+def grid_order(num_cells: int, curve: str = 'morton') -> np.ndarray:
+    # Position of each cell of a num_cells^3 grid along the curve, as an
+    # array indexed by [x, y, z] with values 0 ... num_cells^3 - 1. Keys are
+    # ranked, so the positions are contiguous even if num_cells is not a
+    # power of 2.
+    x, y, z = np.meshgrid(*(np.arange(num_cells),) * 3, indexing='ij')
+    keys = sfc_key(x.ravel(), y.ravel(), z.ravel(), grid_bits(num_cells), curve)
+    order = np.empty(num_cells ** 3, dtype=np.int64)
+    order[np.argsort(keys, kind='stable')] = np.arange(num_cells ** 3)
+    return order.reshape((num_cells,) * 3)
+
@@ -0,0 +1,77 @@
+"""
+Regular grids of cubes (tiles, top-level cells) drawn as one
+Poly3DCollection built from vectorised face arrays.
+"""
+import numpy as np
+from matplotlib.colors import to_rgba_array
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from typing import Tuple, Union, Sequence
+
+# Corners of the unit square, in order around a face
+square_corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+
+
+def grid_faces(
+        shape: Tuple[int, int, int],
+        cell_size: Union[float, Sequence[float]] = 1.,
+        origin: Union[float, Sequence[float]] = 0.,
+        outer_only: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+
+    # Quads of the faces of the cells of a grid, as a (faces, 4, 3) array,
+    # and the flat (C order) index of the cell of each face. Shared faces
+    # are drawn once per cell, unless outer_only, which keeps the faces on
+    # the surface of the grid only.
+    shape = np.asarray(shape)
+    cell_size = np.broadcast_to(np.asarray(cell_size, dtype=float), (3,))
+    origin = np.broadcast_to(np.asarray(origin, dtype=float), (3,))
+    cells = np.stack(np.unravel_index(np.arange(np.prod(shape)), tuple(shape)), axis=1)
+
+    faces = []
+    face_cells = []
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        for side in (0, 1):
+            on_side = cells if not outer_only else cells[cells[:, axis] == side * (shape[axis] - 1)]
+            corners = np.repeat(on_side[:, np.newaxis, :], 4, axis=1).astype(float)
+            corners[:, :, axis] += side
+            corners[:, :, others] += square_corners
+            faces.append(origin + corners * cell_size)
+            face_cells.append(np.ravel_multi_index(on_side.T, tuple(shape)))
+    return np.concatenate(faces), np.concatenate(face_cells)
+
+
+def checkerboard_colors(shape: Tuple[int, int, int], even: str, odd: str) -> np.ndarray:
+    # Colour of each cell (C order), alternating with the parity of i + j + k
+    i, j, k = np.meshgrid(*(np.arange(n) for n in shape), indexing='ij')
+    return np.where(((i + j + k) % 2 == 0).ravel(), even, odd)
+
+
+def draw_grid(
+        ax,
+        shape: Tuple[int, int, int],
+        colors,
+        cell_size: Union[float, Sequence[float]] = 1.,
+        origin: Union[float, Sequence[float]] = 0.,
+        alpha: float = 1.,
+        max_faces: int = 20000,
+        **kwargs
+) -> Poly3DCollection:
+
+    # Draws the cells of a grid on 3D axes, with one colour per cell (C
+    # order) or one for all. Above max_faces faces, only the outer faces
+    # are drawn.
+    num_cells = int(np.prod(shape))
+    faces, face_cells = grid_faces(shape, cell_size, origin, outer_only=6 * num_cells > max_faces)
+    rgba = to_rgba_array(colors)
+    rgba = np.broadcast_to(rgba, (num_cells, 4)).copy() if len(rgba) == 1 else rgba.copy()
+    rgba[:, 3] *= alpha
+
+    # Collections do not update the data limits
+    had_data = ax.has_data()
+    collection = Poly3DCollection(faces, facecolors=rgba[face_cells], **kwargs)
+    ax.add_collection3d(collection)
+    origin = np.broadcast_to(np.asarray(origin, dtype=float), (3,))
+    upper = origin + np.asarray(shape) * np.broadcast_to(np.asarray(cell_size, dtype=float), (3,))
+    ax.auto_scale_xyz(*zip(origin, upper), had_data=had_data)
+    return collection